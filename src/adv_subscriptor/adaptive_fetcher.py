@@ -0,0 +1,126 @@
+import asyncio
+import os
+import sys
+import time
+from typing import Any, Awaitable, Callable, Hashable, Optional
+from metagpt.logs import logger
+from metagpt.utils.parse_html import WebPage
+from browser_pool import browser_pool
+from parse_pool import ParseTimeoutError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from http_session import http_sessions
+from single_flight import single_flight
+from tracing import tracer
+
+# 自适应的页面获取: 先用普通的http GET获取html, parse结果非空时说明页面不需要执行js,
+# 之后该url一直走静态请求(约100ms); 否则回退到playwright渲染, 并记住该url需要浏览器
+FETCH_STATIC = "static"
+FETCH_BROWSER = "browser"
+DEFAULT_STATIC_TIMEOUT = 10  # s
+# 标记为需要浏览器的url, 超过该秒数后重新尝试静态请求, 应对网站改版
+DEFAULT_RECHECK_INTERVAL = 86400
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+}
+
+
+def has_content(data: Any) -> bool:
+    # 至少有一个非空的叶子节点才认为抓到了内容: {"titles": [], "links": []}这样只有空容器的结果
+    # 通常是js渲染的页面在静态html中只有空的骨架
+    if data is None:
+        return False
+    if isinstance(data, (str, bytes)):
+        return len(data.strip()) > 0
+    if isinstance(data, dict):
+        return any(has_content(value) for value in data.values())
+    if isinstance(data, (list, tuple, set)):
+        return any(has_content(item) for item in data)
+    return True
+
+
+class AdaptiveFetcher:
+    def __init__(
+        self,
+        browser_run: Callable = None,
+        static_timeout: float = DEFAULT_STATIC_TIMEOUT,
+        recheck_interval: float = DEFAULT_RECHECK_INTERVAL,
+    ):
+        self.browser_run = browser_run or browser_pool.run
+        self.static_timeout = static_timeout
+        self.recheck_interval = recheck_interval
+        # url -> (fetch mode, 记录的时间)
+        self.modes: dict[str, tuple[str, float]] = {}
+        self.static_hits = 0
+        self.browser_hits = 0
+
+    def mode(self, url: str) -> Optional[str]:
+        mode, since = self.modes.get(url, (None, 0))
+        if mode == FETCH_BROWSER and time.time() - since > self.recheck_interval:
+            return None
+        return mode
+
+    async def fetch_parse(
+        self, url: str, parse: Callable[[WebPage], Awaitable[Any]], parse_key: Optional[Hashable] = None
+    ) -> Any:
+        # 返回await parse(page)的结果; parse_key标识parse的逻辑(如parse代码的hash), 指定时同一(url, parse_key)
+        # 同时只抓取和parse一次, 并发的调用方共享同一个结果
+        if parse_key is None:
+            return await self._fetch_parse(url, parse)
+        return await single_flight.do((url, parse_key), lambda: self._fetch_parse(url, parse))
+
+    async def _fetch_parse(self, url: str, parse: Callable[[WebPage], Awaitable[Any]]) -> Any:
+        if self.mode(url) != FETCH_BROWSER:
+            try:
+                with tracer.span("fetch", mode=FETCH_STATIC):
+                    page = await self.fetch_static(url)
+            except Exception as e:
+                logger.info(f"static fetch of {url} failed: {e}, fallback to browser")
+                page = None
+            if page is not None:
+                try:
+                    with tracer.span("parse"):
+                        data = await parse(page)
+                except (ParseTimeoutError, asyncio.TimeoutError):
+                    # 超时来自parse本身, 换成浏览器渲染的页面再parse一次只会让耗时翻倍
+                    raise
+                except Exception as e:
+                    # parse代码在静态html上找不到元素而出错时, 与没有内容一样回退到浏览器
+                    logger.info(f"parse of the static page {url} failed: {e}, fallback to browser")
+                    data = None
+                if has_content(data):
+                    self._remember(url, FETCH_STATIC)
+                    self.static_hits += 1
+                    return data
+                logger.info(f"static fetch of {url} parsed no content, fallback to browser")
+
+        with tracer.span("fetch", mode=FETCH_BROWSER):
+            page = await self.browser_run(url)
+        self.browser_hits += 1
+        self._remember(url, FETCH_BROWSER)
+        with tracer.span("parse"):
+            return await parse(page)
+
+    async def fetch_static(self, url: str) -> WebPage:
+        # 使用进程内共享的连接池; 与browser_pool一致, 走配置的代理
+        html = await http_sessions.get_text(url, headers=DEFAULT_HEADERS, timeout=self.static_timeout, use_proxy=True)
+        # parse只使用page.html, 不再为inner_text额外解析一次html
+        return WebPage(inner_text="", html=html, url=url)
+
+    def _remember(self, url: str, mode: str):
+        previous = self.modes.get(url, (None, 0))[0]
+        if previous != mode:
+            logger.info(f"fetch {url} via {mode}")
+        self.modes[url] = (mode, time.time())
+
+    async def close(self):
+        # 静态请求使用的是共享的连接池, 在进程退出前关闭
+        await http_sessions.close()
+
+
+# 进程内共享, 各订阅共用url的fetch mode
+adaptive_fetcher = AdaptiveFetcher()
@@ -6,13 +6,21 @@ from metagpt.logs import logger
 from metagpt.team import Team
 from metagpt.actions.action_node import ActionNode
 from metagpt.schema import Message
-from metagpt.utils.parse_html import _get_soup
 from metagpt.tools.web_browser_engine import WebBrowserEngine
 from metagpt.utils.common import CodeParser,any_to_str 
-from metagpt.utils.parse_html import WebPage
-from metagpt.tools import WebBrowserEngineType
 from metagpt.subscription import SubscriptionRunner
+from outline import build_outline
+from browser_pool import browser_pool, pooled_browser_engine
+from adaptive_fetcher import adaptive_fetcher
+from parse_registry import code_key, split_parse_codes
+from parse_pool import parse_pool
 from uuid import uuid4
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from cron_scheduler import cron_scheduler
+from llm_cache import CachedAction
+from map_reduce import MAP_PROMPT, map_reduce_summarize
 
 # ActionNode的keyword param的含义，和prompt的6个方面的含义一致；
 LANGUAGE = ActionNode(
@@ -85,46 +93,16 @@ Answer the question based on the provided context {process}. If the question can
 {data}
 """
 # The action parse the original requirements
-class ParseSubRequirement(Action):
+class ParseSubRequirement(CachedAction):
     async def run(self, requirements: Message):
         # the user requirement stored in the rc.memory
         requirements = "\n".join(i.content for i in requirements)
         context = TEMPALTE_PARSE_SUB_REQUIREMENTS.format(requirements=requirements)
-        node = await PARSE_SUB_REQUIREMENT_NODE.fill(context=context, llm=self.llm)
+        # fill解析成功后响应才写入缓存, 失败重试时不读缓存
+        async with self.cached_llm as llm:
+            node = await PARSE_SUB_REQUIREMENT_NODE.fill(context=context, llm=llm)
         return node
 
-# Below function is to get the dict depicting the outline of html crawled
-def get_outline(page: WebPage):
-    soup = _get_soup(page.html)
-    outline = []
-
-    def process_element(element, depth):
-        name = element.name
-        if not name:
-            return
-        if name in ["script", "style"]:
-            return
-        
-        element_info = { "name": element.name, "depth": depth }
-        if name in ["svg"]:
-            element_info["text"] = None
-            outline.append(element_info)
-            return
-
-        element_info["text"] = element.string
-        if "id" in element.attrs:
-            element_info["id"] = element["id"]
-        if "class" in element.attrs:
-            element_info["class"] = element["class"]
-        
-        outline.append(element_info)
-        for child in element.children:
-            process_element(child, depth+1)
-    
-    for element in soup.body.children:
-        process_element(element, 1)
-    return outline
-
 # this template is used to generate the parse user's requirement in the crawled html
 # {requirement}: e.g. the PAGE_CONTENT_EXTRACTION in the parsed requirements
 # {outline}: e.g. the outline of the html page
@@ -154,24 +132,41 @@ The outline of the HTML page is as follows:
 
 # After the ParseSubRequirement action. this action generate the parse function that can extract the user's requirement
 class WriteCrawleCode(Action):
+    # 各url的页面加载和代码生成并发执行, 分别限制同时打开的浏览器页面数和同时进行的LLM请求数
+    max_concurrent_pages: int = 4
+    max_concurrent_llm: int = 2
+
     async def run(self, requirements) -> str:
         requirement: Message = requirements[-1]
         data = requirement.instruct_content.dict()
         urls = data['Crawler URL List']
         query = data['Page Content Extraction']
 
+        page_limit = asyncio.Semaphore(self.max_concurrent_pages)
+        llm_limit = asyncio.Semaphore(self.max_concurrent_llm)
+        results = await asyncio.gather(
+            *(self._write_code(url, query, page_limit, llm_limit) for url in urls), return_exceptions=True
+        )
+        # 按urls的顺序组合结果; 某个url失败时只跳过该url, 不影响其他url已生成的代码
         codes = {}
-        for url in urls:
-            codes[url] = await self._write_code(url, query)
+        for url, result in zip(urls, results):
+            if isinstance(result, BaseException):
+                logger.opt(exception=result).error(f"failed to write crawle code for {url}")
+                continue
+            codes[url] = result
         return "\n".join(f"# {url}\n{code}" for url, code in codes.items())
 
-    async def _write_code(self, url, query):
-        page = await WebBrowserEngine(WebBrowserEngineType.PLAYWRIGHT).run(url)
-        outline = get_outline(page)
-        outline = "\n".join(f"{' '*i['depth']}{'.'.join([i['name'], *i.get('class', [])])}:{i['text'] if i['text'] else ''}" for i in outline)
+    async def _write_code(self, url, query, page_limit: asyncio.Semaphore, llm_limit: asyncio.Semaphore):
+        async with page_limit:
+            # 复用进程内共享的浏览器, 不再为每个url启动一个浏览器
+            page = await pooled_browser_engine().run(url)
+        # outline按节点数/深度/字符数预算截断, 避免生成过大的prompt
+        outline, stats = build_outline(page)
+        logger.info(f"{url}: {stats.summary()}")
         # logger.info(f"outline: {outline}")
 
-        code_rsp = await self._aask(TEMPLATE_PROMPT.format(requirements=query, outline=outline))
+        async with llm_limit:
+            code_rsp = await self._aask(TEMPLATE_PROMPT.format(requirements=query, outline=outline))
         code = CodeParser.parse_code(block="", text=code_rsp)
         return code
 
@@ -198,32 +193,39 @@ class RunSubscription(Action):
             print(msg)
 
         await runner.subscribe(role, CronTrigger(spec), callback)
-        await runner.run()
+        try:
+            await runner.run()
+        finally:
+            await adaptive_fetcher.close()
+            await parse_pool.close()
+            await browser_pool.close()
     
     @staticmethod
     def create_sub_action_cls(urls: list[str], code, process):
         print(f"create_sub_action_cls urls={urls}, code={code}, process={process}")
-        modules = {}
-        for url in urls[::-1]:
-            code, current = code.rsplit(f"# {url}", maxsplit=1)
-            name = uuid4().hex
-            module = type(sys)(name)
-            # 把parse function定义为moduled的function
-            exec(current, module.__dict__)
-        modules[url] = module
 
-        class SubAction(Action):
+        class SubAction(CachedAction):
             async def run(self, *args, **kwargs):
-                pages = await WebBrowserEngine().run(*urls)
-                if len(urls) == 1:
-                    pages = [pages]
-                
-                data = []
-                for url, page in zip(urls, pages):
-                    # getattr 是builtin.pyi中function, 
-                    data.append(getattr(modules[url], "parse")(page.soup))
-                # SubAction 根据parse 抓取的内容，回答用户的Post Processing requirements
-                return await self.llm.aask(TEMPLATE_SUB_ACTION.format(process=process, data=data))
+                # parse function在子进程池中执行, 按代码hash缓存, trigger每次触发不再重复compile/exec
+                sources = split_parse_codes(code, urls)
+                # 能用静态请求拿到内容的页面不再经过浏览器渲染
+                # 其他订阅同时抓取同一url且parse代码相同时, 共享同一次抓取和parse
+                data = await asyncio.gather(*(
+                    adaptive_fetcher.fetch_parse(
+                        url,
+                        lambda page, source=source: parse_pool.parse(source, page.html),
+                        parse_key=code_key(source),
+                    )
+                    for url, source in sources.items()
+                ))
+                # SubAction 根据parse 抓取的内容，回答用户的Post Processing requirements; 超出token预算时map-reduce
+                return await map_reduce_summarize(
+                    self._aask,
+                    data,
+                    lambda records: TEMPLATE_SUB_ACTION.format(process=process, data=records),
+                    lambda chunk, index, total: MAP_PROMPT.format(process=process, index=index, total=total, data=chunk),
+                    model=getattr(self.llm, "model", None),
+                )
 
         return SubAction
 
@@ -276,10 +278,14 @@ class SubscriptionAssistant(Role):
 # TRIGGER_INTERVAL = 10
 TRIGGER_INTERVAL = 86400
 
+# 按cron表达式触发; 没有cron表达式时按TRIGGER_INTERVAL触发
 async def CronTrigger(cron_exp: str):
-    while True:
+    if not cron_exp:
+        while True:
+            yield Message(content="CroneTrigger")
+            await asyncio.sleep(TRIGGER_INTERVAL)
+    async for _ in cron_scheduler.trigger(cron_exp):
         yield Message(content="CroneTrigger")
-        await asyncio.sleep(TRIGGER_INTERVAL)
 
 if __name__ == "__main__":
     async def test():
@@ -321,7 +327,10 @@ if __name__ == "__main__":
         team.hire([SubscriptionAssistant(), CrawleEngineer()])
         requirement = "从36kr创投平台https://pitchhub.36kr.com/financing-flash爬取所有初创企业融资的信息，获取标题，链接， 时间，总结今天的融资新闻，然后在14:55发送给我"
         team.run_project(requirement)
-        await team.run()
+        try:
+            await team.run()
+        finally:
+            await browser_pool.close()
 
     # asyncio.run(test())
     asyncio.run(main())
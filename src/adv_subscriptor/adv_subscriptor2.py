@@ -6,14 +6,18 @@ from metagpt.logs import logger
 from metagpt.team import Team
 from metagpt.actions.action_node import ActionNode
 from metagpt.schema import Message
-from metagpt.utils.parse_html import _get_soup
-from metagpt.tools.web_browser_engine import WebBrowserEngine
 from metagpt.utils.common import CodeParser,any_to_str 
-from metagpt.utils.parse_html import WebPage
-from metagpt.tools import WebBrowserEngineType
-from metagpt.subscription import SubscriptionRunner
+from outline import build_outline
+from browser_pool import browser_pool, pooled_browser_engine
+from worker_daemon import DEFAULT_SOCKET_PATH, send_command, watch_worker
+from ipc import FRAME_ERROR, FRAME_RESULT
 from uuid import uuid4
-from subprocess import Popen,PIPE,STDOUT
+from subprocess import DEVNULL, STDOUT, Popen
+import os
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from llm_cache import CachedAction
 
 # ActionNode的keyword param的含义，和prompt的6个方面的含义一致；
 LANGUAGE = ActionNode(
@@ -86,46 +90,16 @@ Answer the question based on the provided context {process}. If the question can
 {data}
 """
 # The action parse the original requirements
-class ParseSubRequirement(Action):
+class ParseSubRequirement(CachedAction):
     async def run(self, requirements: Message):
         # the user requirement stored in the rc.memory
         requirements = "\n".join(i.content for i in requirements)
         context = TEMPALTE_PARSE_SUB_REQUIREMENTS.format(requirements=requirements)
-        node = await PARSE_SUB_REQUIREMENT_NODE.fill(context=context, llm=self.llm)
+        # fill解析成功后响应才写入缓存, 失败重试时不读缓存
+        async with self.cached_llm as llm:
+            node = await PARSE_SUB_REQUIREMENT_NODE.fill(context=context, llm=llm)
         return node
 
-# Below function is to get the dict depicting the outline of html crawled
-def get_outline(page: WebPage):
-    soup = _get_soup(page.html)
-    outline = []
-
-    def process_element(element, depth):
-        name = element.name
-        if not name:
-            return
-        if name in ["script", "style"]:
-            return
-        
-        element_info = { "name": element.name, "depth": depth }
-        if name in ["svg"]:
-            element_info["text"] = None
-            outline.append(element_info)
-            return
-
-        element_info["text"] = element.string
-        if "id" in element.attrs:
-            element_info["id"] = element["id"]
-        if "class" in element.attrs:
-            element_info["class"] = element["class"]
-        
-        outline.append(element_info)
-        for child in element.children:
-            process_element(child, depth+1)
-    
-    for element in soup.body.children:
-        process_element(element, 1)
-    return outline
-
 # this template is used to generate the parse user's requirement in the crawled html
 # {requirement}: e.g. the PAGE_CONTENT_EXTRACTION in the parsed requirements
 # {outline}: e.g. the outline of the html page
@@ -155,24 +129,44 @@ The outline of the HTML page is as follows:
 
 # After the ParseSubRequirement action. this action generate the parse function that can extract the user's requirement
 class WriteCrawleCode(Action):
+    # 各url的页面加载和代码生成并发执行, 分别限制同时打开的浏览器页面数和同时进行的LLM请求数
+    max_concurrent_pages: int = 4
+    max_concurrent_llm: int = 2
+
     async def run(self, requirements) -> str:
         requirement: Message = requirements[-1]
         data = requirement.instruct_content.model_dump()
         urls = data['Crawler URL List']
         query = data['Page Content Extraction']
 
+        page_limit = asyncio.Semaphore(self.max_concurrent_pages)
+        llm_limit = asyncio.Semaphore(self.max_concurrent_llm)
+        results = await asyncio.gather(
+            *(self._write_code(url, query, page_limit, llm_limit) for url in urls), return_exceptions=True
+        )
+        # 按urls的顺序组合结果; 某个url失败时只跳过该url, 不影响其他url已生成的代码
         codes = {}
-        for url in urls:
-            codes[url] = await self._write_code(url, query)
+        for url, result in zip(urls, results):
+            if isinstance(result, BaseException):
+                logger.opt(exception=result).error(f"failed to write crawle code for {url}")
+                continue
+            codes[url] = result
+        # 所有url都失败时不再继续, 避免注册一个没有url的空订阅
+        if not codes:
+            raise RuntimeError(f"failed to write crawle code for all urls: {urls}")
         return "\n".join(f"# {url}\n{code}" for url, code in codes.items())
 
-    async def _write_code(self, url, query):
-        page = await WebBrowserEngine(WebBrowserEngineType.PLAYWRIGHT).run(url)
-        outline = get_outline(page)
-        outline = "\n".join(f"{' '*i['depth']}{'.'.join([i['name'], *i.get('class', [])])}:{i['text'] if i['text'] else ''}" for i in outline)
+    async def _write_code(self, url, query, page_limit: asyncio.Semaphore, llm_limit: asyncio.Semaphore):
+        async with page_limit:
+            # 复用进程内共享的浏览器, 不再为每个url启动一个浏览器
+            page = await pooled_browser_engine().run(url)
+        # outline按节点数/深度/字符数预算截断, 避免生成过大的prompt
+        outline, stats = build_outline(page)
+        logger.info(f"{url}: {stats.summary()}")
         # logger.info(f"outline: {outline}")
 
-        code_rsp = await self._aask(TEMPLATE_PROMPT.format(requirements=query, outline=outline))
+        async with llm_limit:
+            code_rsp = await self._aask(TEMPLATE_PROMPT.format(requirements=query, outline=outline))
         code = CodeParser.parse_code(block="", text=code_rsp)
         return code
 
@@ -187,20 +181,61 @@ class RunSubscription(Action):
         process = req['Crawle Post Processing']
         spec = req['Cron Expression']
 
-        # start a new process to run the subscription
-        spawn_subprocess(urls, code, process, spec)
-        return Message(content="RunSubscription done")
-
-def spawn_subprocess(urls, code, process, spec, *, file_path="./src/adv_subscriptor/worker.py"):
-    p = Popen(["python", file_path, str(urls), code, process, spec], stdout=PIPE, stderr=STDOUT)
-    # using nohup to record output in file
-    # Popen(["nohup", "python", file_path, str(urls), code, process, spec])
-
-    # read the output of the subprocess
-    for line in iter(p.stdout.readline, b""):
-        print(line.decode(), end="")
-    p.stdout.close()
-    p.wait()
+        # 订阅交给常驻的worker进程托管, 不再为每个订阅启动一个python进程
+        sub_id = uuid4().hex
+        await ensure_worker()
+        rsp = await send_command({
+            "op": "add",
+            "subscription": {
+                "id": sub_id, "urls": urls, "code": code, "process": process, "spec": spec, "requirement": req,
+            },
+        })
+        if not rsp.get("ok"):
+            raise RuntimeError(f"failed to add subscription: {rsp.get('error')}")
+        return Message(content=f"RunSubscription done: {sub_id}")
+
+WORKER_DAEMON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker_daemon.py")
+# worker的stdout/stderr, 启动失败时在这里查看原因
+WORKER_LOG_PATH = os.environ.get("SUBSCRIPTION_WORKER_LOG", "/tmp/metagpt-subscription-worker.log")
+READY_POLL_INTERVAL = 0.2  # s
+
+async def ping_worker(socket_path=DEFAULT_SOCKET_PATH) -> bool:
+    try:
+        await send_command({"op": "ping"}, socket_path)
+        return True
+    except (FileNotFoundError, ConnectionRefusedError):
+        return False
+
+# 跟随worker推送的帧: 输出订阅的结果和错误, 直到worker退出
+async def follow_worker(socket_path=DEFAULT_SOCKET_PATH):
+    async for frame in watch_worker(socket_path):
+        if frame.get("type") == FRAME_RESULT:
+            logger.info(f"subscription {frame['id']}: {frame['content']}")
+        elif frame.get("type") == FRAME_ERROR:
+            logger.error(f"subscription {frame['id']} failed: {frame['error']}")
+        else:
+            logger.debug(f"subscription worker: {frame}")
+
+# 确保worker进程在运行: control socket不可用时启动一个, 并等待其就绪
+async def ensure_worker(socket_path=DEFAULT_SOCKET_PATH, *, file_path=WORKER_DAEMON_PATH, timeout: float = 60):
+    if await ping_worker(socket_path):
+        return
+    # 用Popen而不是asyncio的subprocess: worker不绑定当前event loop的transport, 加上start_new_session,
+    # 当前进程(及其event loop)退出后worker和订阅继续运行; 之后只通过control socket通信
+    with open(WORKER_LOG_PATH, "ab") as log:
+        daemon = Popen(
+            [sys.executable, file_path, "--socket", socket_path],
+            stdin=DEVNULL, stdout=log, stderr=STDOUT, start_new_session=True,
+        )
+    deadline = time.monotonic() + timeout
+    while not await ping_worker(socket_path):
+        code = daemon.poll()
+        # 退出码为0: 已有其他worker在该socket上服务(如并发的ensure_worker), 继续等它就绪
+        if code:
+            raise RuntimeError(f"subscription worker exited with {code}, see {WORKER_LOG_PATH}")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"subscription worker is not ready on {socket_path}")
+        await asyncio.sleep(READY_POLL_INTERVAL)
 
 
 class CrawleEngineer(Role):
@@ -255,7 +290,12 @@ if __name__ == "__main__":
         team.hire([SubscriptionAssistant(), CrawleEngineer()])
         requirement = "从36kr创投平台https://pitchhub.36kr.com/financing-flash爬取所有初创企业融资的信息，获取标题，链接， 时间，总结今天的融资新闻，然后在14:55发送给我"
         team.run_project(requirement)
-        await team.run()
+        try:
+            await team.run()
+        finally:
+            await browser_pool.close()
+        # 订阅由worker托管, 这里只接收worker推送的结果, 退出不影响订阅的运行
+        await follow_worker()
 
     # asyncio.run(test())
     asyncio.run(main())
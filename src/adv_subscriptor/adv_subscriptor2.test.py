@@ -1,4 +1,5 @@
-from adv_subscriptor2 import spawn_subprocess, ParseSubRequirement, WriteCrawleCode
+from adv_subscriptor2 import ensure_worker, ParseSubRequirement, WriteCrawleCode
+from worker_daemon import send_command
 from metagpt.schema import Message
 from metagpt.actions.action_node import ActionNode
 from uuid import uuid4
@@ -6,7 +7,7 @@ import sys
 from metagpt.tools.web_browser_engine import WebBrowserEngine
 import asyncio
 
-def test_spawn_subprocess():
+async def test_add_subscription():
     urls = ['https://pitchhub.36kr.com/financing-flash'] 
     req = "生成今天的融资新闻总结。"
     cron_exp = "55 14 * * *"
@@ -24,7 +25,13 @@ def parse(page: BeautifulSoup) -> dict:
         results.append({'title': title, 'link': link, 'time': time})
     return results
 """
-    spawn_subprocess(urls, code, req, cron_exp, file_path="./src/adv_subscriptor/worker.py")
+    # 订阅交给常驻的worker进程托管
+    await ensure_worker()
+    rsp = await send_command({
+        "op": "add",
+        "subscription": {"id": uuid4().hex, "urls": urls, "code": code, "process": req, "spec": cron_exp},
+    })
+    print("add subscription=", rsp)
 
 async def test_parse_sub_requirement():
     action = ParseSubRequirement()
@@ -68,6 +75,6 @@ async def test():
     parsed_node = await test_parse_sub_requirement()
     code = await test_generate_parse_code(parsed_node)
     await test_answer_user_req(parsed_node.instruct_content.dict(), code)
-    # test_spawn_subprocess()
+    # await test_add_subscription()
 
 asyncio.run(test())
@@ -0,0 +1,178 @@
+import asyncio
+from typing import Optional, Union
+from playwright.async_api import async_playwright
+from metagpt.config import CONFIG
+from metagpt.logs import logger
+from metagpt.tools import WebBrowserEngineType
+from metagpt.tools.web_browser_engine import WebBrowserEngine
+from metagpt.utils.parse_html import WebPage
+
+# 进程内共享的playwright浏览器池: 只启动一个浏览器, 维护若干个预热的context,
+# 限制同时打开的page数, 每个context服务一定数量的page后被回收重建, 以控制浏览器的内存增长
+DEFAULT_MAX_CONTEXTS = 2
+DEFAULT_MAX_PAGES = 8
+DEFAULT_PAGES_PER_CONTEXT = 50
+DEFAULT_PAGE_TIMEOUT = 30000  # ms
+
+
+class _PooledContext:
+    def __init__(self, context):
+        self.context = context
+        self.served = 0     # 已分配的page数
+        self.active = 0     # 正在使用的page数
+        self.retired = False
+
+
+class BrowserPool:
+    def __init__(
+        self,
+        browser_type: Optional[str] = None,
+        max_contexts: int = DEFAULT_MAX_CONTEXTS,
+        max_pages: int = DEFAULT_MAX_PAGES,
+        pages_per_context: int = DEFAULT_PAGES_PER_CONTEXT,
+        page_timeout: int = DEFAULT_PAGE_TIMEOUT,
+        launch_kwargs: Optional[dict] = None,
+        context_kwargs: Optional[dict] = None,
+    ):
+        self.browser_type = browser_type or CONFIG.playwright_browser_type or "chromium"
+        self.max_contexts = max_contexts
+        self.max_pages = max_pages
+        self.pages_per_context = pages_per_context
+        self.page_timeout = page_timeout
+        self.launch_kwargs = dict(launch_kwargs or {})
+        if CONFIG.GLOBAL_PROXY and "proxy" not in self.launch_kwargs:
+            self.launch_kwargs["proxy"] = {"server": CONFIG.GLOBAL_PROXY}
+        self.context_kwargs = context_kwargs or {}
+
+        self._playwright = None
+        self._browser = None
+        self._contexts: list[_PooledContext] = []
+        # asyncio的对象在start时创建, 使其绑定到实际运行的event loop
+        self._start_task: Optional[asyncio.Future] = None
+        self._page_limit: Optional[asyncio.Semaphore] = None
+        self._context_lock: Optional[asyncio.Lock] = None
+        self.pages_served = 0
+        self.contexts_recycled = 0
+
+    @property
+    def started(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    async def start(self):
+        if self.started:
+            return
+        if self._start_task is None or self._start_task.done():
+            self._start_task = asyncio.ensure_future(self._launch())
+        # shield: 调用方被取消时不打断浏览器的启动, 否则playwright的driver进程会泄漏
+        await asyncio.shield(self._start_task)
+
+    async def _launch(self):
+        if self._browser is not None:
+            logger.warning("browser disconnected, relaunch it")
+            await self._shutdown()
+        try:
+            self._playwright = await async_playwright().start()
+            self._browser = await getattr(self._playwright, self.browser_type).launch(**self.launch_kwargs)
+            self._page_limit = asyncio.Semaphore(self.max_pages)
+            self._context_lock = asyncio.Lock()
+            # 预热context, 避免第一批爬取时才创建
+            for _ in range(self.max_contexts):
+                self._contexts.append(await self._new_context())
+        except Exception:
+            await self._shutdown()
+            raise
+        logger.info(f"browser pool started: {self.browser_type}, contexts={self.max_contexts}, pages={self.max_pages}")
+
+    async def close(self):
+        if self._start_task is not None and not self._start_task.done():
+            try:
+                await self._start_task
+            except Exception as e:
+                logger.debug(f"browser pool failed to start: {e}")
+        await self._shutdown()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    # 与PlaywrightWrapper.run的签名一致, 可作为WebBrowserEngine的CUSTOM run_func
+    async def run(self, url: str, *urls: str) -> Union[WebPage, list[WebPage]]:
+        if not self.started:
+            await self.start()
+        if urls:
+            return await asyncio.gather(self._scrape(url), *(self._scrape(i) for i in urls))
+        return await self._scrape(url)
+
+    async def _scrape(self, url: str) -> WebPage:
+        async with self._page_limit:
+            pooled = await self._acquire_context()
+            try:
+                page = await pooled.context.new_page()
+                async with page:
+                    try:
+                        await page.goto(url, timeout=self.page_timeout)
+                        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                        html = await page.content()
+                        inner_text = await page.evaluate("() => document.body.innerText")
+                    except Exception as e:
+                        inner_text = f"Fail to load page content for {e}"
+                        html = ""
+                    return WebPage(inner_text=inner_text, html=html, url=url)
+            finally:
+                await self._release_context(pooled)
+
+    async def _new_context(self) -> _PooledContext:
+        return _PooledContext(await self._browser.new_context(**self.context_kwargs))
+
+    async def _acquire_context(self) -> _PooledContext:
+        if len(self._contexts) < self.max_contexts:
+            # 创建context期间其他调用方也可能进入这里, 加锁后重新检查, 避免超出max_contexts
+            async with self._context_lock:
+                if len(self._contexts) < self.max_contexts:
+                    self._contexts.append(await self._new_context())
+        pooled = min(self._contexts, key=lambda i: i.active)
+        pooled.active += 1
+        pooled.served += 1
+        self.pages_served += 1
+        if pooled.served >= self.pages_per_context:
+            # 不再分配新的page, 等正在使用的page结束后关闭
+            pooled.retired = True
+            self._contexts.remove(pooled)
+        return pooled
+
+    async def _release_context(self, pooled: _PooledContext):
+        pooled.active -= 1
+        if pooled.retired and pooled.active == 0:
+            self.contexts_recycled += 1
+            try:
+                await pooled.context.close()
+            except Exception as e:
+                logger.warning(f"failed to close browser context: {e}")
+
+    async def _shutdown(self):
+        contexts, self._contexts = self._contexts, []
+        for pooled in contexts:
+            try:
+                await pooled.context.close()
+            except Exception as e:
+                logger.debug(f"failed to close browser context: {e}")
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception as e:
+                logger.debug(f"failed to close browser: {e}")
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+# 进程内共享的浏览器池
+browser_pool = BrowserPool()
+
+
+def pooled_browser_engine() -> WebBrowserEngine:
+    return WebBrowserEngine(WebBrowserEngineType.CUSTOM, run_func=browser_pool.run)
@@ -0,0 +1,105 @@
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any
+
+# 订阅结果的变更检测: 按(订阅, url)记录上次parse结果的内容hash;
+# 结果没有变化时复用上次的总结(或不再推送), 只有部分新增时只把新增的记录发给LLM
+UNCHANGED_REUSE = "reuse"
+UNCHANGED_SUPPRESS = "suppress"
+
+
+def fingerprint(value: Any) -> str:
+    text = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _items(data: Any) -> list:
+    # parse返回list时逐条比较, 否则整体作为一条记录
+    return list(data) if isinstance(data, (list, tuple)) else [data]
+
+
+@dataclass
+class UrlState:
+    digest: str
+    items: set[str]
+
+
+@dataclass
+class Delta:
+    changed: bool
+    # url -> 新增的记录; 只有所有变化都是新增记录时才可以增量总结
+    new_items: dict[str, list] = field(default_factory=dict)
+    incremental: bool = False
+    previous_summary: str = None
+
+
+class ChangeDetector:
+    def __init__(self):
+        # subscription key -> url -> UrlState
+        self._states: dict[str, dict[str, UrlState]] = {}
+        self._summaries: dict[str, str] = {}
+        self.unchanged = 0
+        self.incremental = 0
+        self.full = 0
+
+    def diff(self, key: str, data: dict[str, Any]) -> Delta:
+        states = self._states.get(key, {})
+        previous_summary = self._summaries.get(key)
+        if set(states) != set(data):
+            self.full += 1
+            return Delta(changed=True, previous_summary=previous_summary)
+
+        new_items, removed = {}, False
+        for url, value in data.items():
+            state = states[url]
+            if fingerprint(value) == state.digest:
+                continue
+            items = _items(value)
+            digests = [fingerprint(i) for i in items]
+            added = [item for item, digest in zip(items, digests) if digest not in state.items]
+            removed = removed or not state.items.issubset(digests)
+            if added:
+                new_items[url] = added
+
+        if not new_items and not removed:
+            self.unchanged += 1
+            return Delta(changed=False, previous_summary=previous_summary)
+        incremental = not removed and previous_summary is not None
+        if incremental:
+            self.incremental += 1
+        else:
+            self.full += 1
+        return Delta(changed=True, new_items=new_items, incremental=incremental, previous_summary=previous_summary)
+
+    def commit(self, key: str, data: dict[str, Any], summary: str):
+        # LLM总结成功后再记录, 失败的运行下次仍会重新总结
+        self._states[key] = {
+            url: UrlState(fingerprint(value), {fingerprint(i) for i in _items(value)}) for url, value in data.items()
+        }
+        self._summaries[key] = summary
+
+    def forget(self, key: str):
+        self._states.pop(key, None)
+        self._summaries.pop(key, None)
+
+    def dump(self, key: str) -> dict:
+        # 导出某个订阅的状态, 便于持久化
+        states = self._states.get(key, {})
+        return {
+            "urls": {url: {"digest": s.digest, "items": sorted(s.items)} for url, s in states.items()},
+            "summary": self._summaries.get(key),
+        }
+
+    def load(self, key: str, state: dict):
+        if not state:
+            return
+        self._states[key] = {
+            url: UrlState(s["digest"], set(s["items"])) for url, s in state.get("urls", {}).items()
+        }
+        if state.get("summary") is not None:
+            self._summaries[key] = state["summary"]
+
+
+# 进程内共享的变更检测状态
+change_detector = ChangeDetector()
@@ -0,0 +1,49 @@
+import asyncio
+import json
+import struct
+from typing import Optional
+
+# 进程间通信的帧格式: 4字节大端长度 + utf-8编码的json; 用于worker_daemon的control socket和parse子进程的pipe.
+# worker_daemon向watch的客户端推送的帧带type字段: status/result/error
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+FRAME_STATUS = "status"
+FRAME_RESULT = "result"
+FRAME_ERROR = "error"
+STATUS_READY = "ready"
+STATUS_ADDED = "added"
+STATUS_REMOVED = "removed"
+
+
+class FrameError(Exception):
+    pass
+
+
+def encode_frame(obj: dict) -> bytes:
+    payload = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FrameError(f"frame too large: {len(payload)} bytes")
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[dict]:
+    # 对端关闭时返回None
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise FrameError("connection closed in frame header")
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise FrameError(f"frame too large: {size} bytes")
+    try:
+        payload = await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        raise FrameError("connection closed in frame payload")
+    return json.loads(payload)
+
+
+async def write_frame(writer: asyncio.StreamWriter, obj: dict):
+    writer.write(encode_frame(obj))
+    await writer.drain()
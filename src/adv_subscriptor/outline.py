@@ -0,0 +1,222 @@
+from __future__ import annotations
+import os
+import sys
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterator, Optional, Union
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+
+if TYPE_CHECKING:
+    # 只用于类型标注, 导入outline不需要metagpt
+    from metagpt.utils.parse_html import WebPage
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from html_parser import get_soup
+
+# 生成html outline的引擎: 用显式的栈代替递归遍历soup.body, 逐行生成outline,
+# 节点数/深度/字符数超出预算时停止, 避免深层DOM触发recursion limit, 以及生成过大的prompt
+SKIP_TAGS = ("script", "style")
+LEAF_TAGS = ("svg",)
+
+DEFAULT_MAX_NODES = 4000
+DEFAULT_MAX_DEPTH = 48
+DEFAULT_MAX_CHARS = 30000
+# 列表页中结构相同的连续兄弟节点只保留前几个作为代表, 其余折叠为"×N more"
+DEFAULT_KEEP_REPEATED = 2
+# 计算子树结构指纹时向下看的层数
+FINGERPRINT_DEPTH = 3
+
+
+@dataclass
+class OutlineStats:
+    nodes: int = 0              # 输出的节点数
+    chars: int = 0              # 输出的字符数(含换行)
+    max_depth: int = 0          # 输出节点的最大深度
+    pruned_subtrees: int = 0    # 因深度预算被剪掉的子树数
+    pruned_nodes: int = 0       # 被剪掉的子树中的节点数
+    omitted_nodes: int = 0      # 因节点/字符预算未输出的节点数
+    collapsed_runs: int = 0     # 被折叠的重复兄弟节点组数
+    collapsed_nodes: int = 0    # 被折叠的节点数(含子树)
+    truncated_by: Optional[str] = None   # "nodes" | "chars", 未截断时为None
+
+    @property
+    def truncated(self) -> bool:
+        return self.truncated_by is not None or self.pruned_subtrees > 0
+
+    def summary(self) -> str:
+        text = f"outline nodes={self.nodes} chars={self.chars} depth={self.max_depth}"
+        if self.collapsed_runs:
+            text += f", collapsed {self.collapsed_runs} repeated runs ({self.collapsed_nodes} nodes)"
+        if self.pruned_subtrees:
+            text += f", pruned {self.pruned_subtrees} subtrees ({self.pruned_nodes} nodes) by depth"
+        if self.truncated_by:
+            text += f", omitted {self.omitted_nodes} nodes by {self.truncated_by} budget"
+        return text
+
+
+class CollapsedSiblings:
+    # 代表一组被折叠的重复兄弟节点, 在outline中输出为"×N more"标记
+    def __init__(self, sample: Tag, count: int):
+        self.name = sample.name
+        self.classes = sample.get("class", [])
+        self.count = count
+
+
+def shape_fingerprint(element: Tag, depth: int = FINGERPRINT_DEPTH) -> int:
+    # 以tag/class的形状作为子树指纹, 子节点取集合, 忽略文本内容及可选子节点的重复次数
+    shape = (element.name, tuple(element.get("class", [])))
+    if depth <= 0 or element.name in LEAF_TAGS:
+        return hash(shape)
+    children = frozenset(
+        shape_fingerprint(child, depth - 1)
+        for child in element.children
+        if child.name and child.name not in SKIP_TAGS
+    )
+    return hash((shape, children))
+
+
+def collapse_siblings(children, keep: int, stats: OutlineStats = None):
+    # 对连续的、指纹相同的兄弟节点, 只产出前keep个, 其余在该组结束后合并为一个CollapsedSiblings
+    run_fp, run_count, run_sample = None, 0, None
+
+    def flush():
+        surplus = run_count - keep
+        if surplus <= 0:
+            return None
+        if stats is not None:
+            stats.collapsed_runs += 1
+            stats.collapsed_nodes += surplus * (1 + len(run_sample.find_all(True)))
+        return CollapsedSiblings(run_sample, surplus)
+
+    for child in children:
+        if not child.name or child.name in SKIP_TAGS:
+            continue
+        fp = shape_fingerprint(child)
+        if fp == run_fp:
+            run_count += 1
+            if run_count <= keep:
+                yield child
+            continue
+        marker = flush()
+        if marker:
+            yield marker
+        run_fp, run_count, run_sample = fp, 1, child
+        yield child
+    marker = flush()
+    if marker:
+        yield marker
+
+
+def iter_elements(
+    root: Tag, max_depth: int = None, stats: OutlineStats = None, keep_repeated: int = None
+) -> Iterator[tuple[int, Union[Tag, CollapsedSiblings]]]:
+    # 先序遍历root的子孙节点, 产出(depth, element); 栈里保存的是各层children的迭代器, 内存只与深度相关
+    # keep_repeated不为None时, 重复的兄弟节点被折叠, 产出CollapsedSiblings
+    def children_of(element):
+        if keep_repeated is None:
+            return iter(element.children)
+        return collapse_siblings(element.children, keep_repeated, stats)
+
+    stack = [(1, children_of(root))]
+    while stack:
+        depth, children = stack[-1]
+        element = next(children, None)
+        if element is None:
+            stack.pop()
+            continue
+        if isinstance(element, CollapsedSiblings):
+            yield depth, element
+            continue
+        name = element.name
+        if not name or name in SKIP_TAGS:
+            continue
+        yield depth, element
+        if name in LEAF_TAGS:
+            continue
+        if max_depth and depth >= max_depth:
+            if stats is not None and element.contents:
+                stats.pruned_subtrees += 1
+                stats.pruned_nodes += len(element.find_all(True))
+            continue
+        stack.append((depth + 1, children_of(element)))
+
+
+def element_text(element: Tag):
+    # 与element.string一致, 但沿单子节点链循环查找, 不会在深层DOM上递归
+    while len(element.contents) == 1:
+        element = element.contents[0]
+        if not isinstance(element, Tag):
+            return element
+    return None
+
+
+def element_info(element: Tag, depth: int) -> dict:
+    info = {"name": element.name, "depth": depth}
+    if element.name in LEAF_TAGS:
+        info["text"] = None
+        return info
+    info["text"] = element_text(element)
+    if "id" in element.attrs:
+        info["id"] = element["id"]
+    if "class" in element.attrs:
+        info["class"] = element["class"]
+    return info
+
+
+def format_element(element: Union[Tag, CollapsedSiblings], depth: int) -> str:
+    if isinstance(element, CollapsedSiblings):
+        # 保留tag.class路径, 便于LLM据此写出选择器
+        return f"{' '*depth}{'.'.join([element.name, *element.classes])}:×{element.count} more"
+    if element.name in LEAF_TAGS:
+        return f"{' '*depth}{element.name}:"
+    text = element_text(element)
+    return f"{' '*depth}{'.'.join([element.name, *element.get('class', [])])}:{text if text else ''}"
+
+
+def iter_outline(
+    root: Tag,
+    *,
+    max_nodes: int = DEFAULT_MAX_NODES,
+    max_depth: int = DEFAULT_MAX_DEPTH,
+    max_chars: int = DEFAULT_MAX_CHARS,
+    keep_repeated: int = DEFAULT_KEEP_REPEATED,
+    stats: OutlineStats = None,
+) -> Iterator[str]:
+    # 逐行产出outline, 预算为None/0表示不限制, keep_repeated为None时不折叠重复节点; 截断/折叠信息记录在stats中
+    stats = stats if stats is not None else OutlineStats()
+    elements = iter_elements(root, max_depth, stats, keep_repeated)
+    for depth, element in elements:
+        if max_nodes and stats.nodes >= max_nodes:
+            stats.truncated_by = "nodes"
+        else:
+            line = format_element(element, depth)
+            if max_chars and stats.chars + len(line) + 1 > max_chars:
+                stats.truncated_by = "chars"
+            else:
+                stats.nodes += 1
+                stats.chars += len(line) + 1
+                stats.max_depth = max(stats.max_depth, depth)
+                yield line
+                continue
+        # 超出预算, 只统计剩余(深度预算内的)节点数, 不再生成文本
+        counters = stats.pruned_subtrees, stats.pruned_nodes, stats.collapsed_runs, stats.collapsed_nodes
+        stats.omitted_nodes = 1 + sum(1 for _ in elements)
+        stats.pruned_subtrees, stats.pruned_nodes, stats.collapsed_runs, stats.collapsed_nodes = counters
+        return
+
+
+def get_outline(page: WebPage) -> list[dict]:
+    # 原来adv_subscriptor中get_outline的输出格式: 每个元素一个dict, 不做预算截断和折叠
+    soup = get_soup(page.html)
+    return [element_info(element, depth) for depth, element in iter_elements(soup.body)]
+
+
+def build_outline(page: Union[WebPage, str, BeautifulSoup], **budget) -> tuple[str, OutlineStats]:
+    if isinstance(page, BeautifulSoup):
+        soup = page
+    else:
+        soup = get_soup(page if isinstance(page, str) else page.html)
+    stats = OutlineStats()
+    root = soup.body or soup
+    text = "\n".join(iter_outline(root, stats=stats, **budget))
+    return text, stats
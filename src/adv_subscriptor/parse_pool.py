@@ -0,0 +1,190 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import Any, Optional
+from metagpt.logs import logger
+from ipc import FRAME_HEADER, FrameError, encode_frame, read_frame, write_frame
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+
+# 在子进程池中执行LLM生成的parse function: 每次调用有墙上时间限制, 支持时还有内存限制(RLIMIT_AS), 结果以json返回;
+# 超时的子进程会被kill并由新的子进程替换, parse再慢也不会阻塞worker的event loop.
+# 这只是进程隔离, 没有文件系统和网络的隔离, parse代码拥有与worker相同的权限
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_TIMEOUT = 10  # s
+DEFAULT_MEMORY_LIMIT = 1024 * 1024 * 1024  # bytes, RLIMIT_AS
+# 等待子进程完成import的时间, 不计入parse的超时
+SPAWN_TIMEOUT = 60
+PARSE_PROCESS_PATH = os.path.abspath(__file__)
+
+
+class ParseError(Exception):
+    pass
+
+
+class ParseTimeoutError(ParseError):
+    pass
+
+
+class _ParseProcess:
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self.calls = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+
+class ParseProcessPool:
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        timeout: float = DEFAULT_TIMEOUT,
+        memory_limit: Optional[int] = DEFAULT_MEMORY_LIMIT,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self._idle: list[_ParseProcess] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.calls = 0
+        self.timeouts = 0
+        self.replaced = 0
+
+    async def parse(self, source: str, html: str, timeout: Optional[float] = None) -> Any:
+        # source为单个url的parse代码, html为页面内容; 返回parse结果(json兼容的数据)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        timeout = timeout or self.timeout
+        async with self._slots:
+            worker = self._idle.pop() if self._idle else await self._spawn()
+            self.calls += 1
+            try:
+                await write_frame(worker.process.stdin, {"source": source, "html": html})
+                response = await asyncio.wait_for(read_frame(worker.process.stdout), timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                await self._kill(worker)
+                raise ParseTimeoutError(f"parse timed out after {timeout}s")
+            except BaseException:
+                await self._kill(worker)
+                raise
+            if response is None:
+                code = await worker.process.wait()
+                self.replaced += 1
+                raise ParseError(f"parse process exited with {code}")
+            worker.calls += 1
+            if response.get("fatal"):
+                # 如内存超限, 子进程已退出, 下次调用时重新启动
+                await self._kill(worker)
+            else:
+                self._idle.append(worker)
+        if not response.get("ok"):
+            raise ParseError(response.get("error"))
+        return response["result"]
+
+    async def _spawn(self) -> _ParseProcess:
+        args = [PARSE_PROCESS_PATH]
+        if self.memory_limit:
+            args += ["--memory-limit", str(self.memory_limit)]
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, *args, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE
+        )
+        worker = _ParseProcess(process)
+        try:
+            ready = await asyncio.wait_for(read_frame(process.stdout), SPAWN_TIMEOUT)
+        except BaseException:
+            await self._kill(worker)
+            raise
+        if ready is None:
+            raise ParseError(f"parse process exited with {await process.wait()} on start")
+        logger.debug(f"parse process {process.pid} started")
+        return worker
+
+    async def _kill(self, worker: _ParseProcess):
+        if worker.alive:
+            worker.process.kill()
+        await worker.process.wait()
+        self.replaced += 1
+        logger.warning(f"parse process {worker.process.pid} killed after {worker.calls} calls")
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.process.stdin.close()
+            try:
+                await asyncio.wait_for(worker.process.wait(), 5)
+            except asyncio.TimeoutError:
+                worker.process.kill()
+                await worker.process.wait()
+
+
+# 进程内共享的parse进程池
+parse_pool = ParseProcessPool()
+
+
+def _read_exactly(stream, size: int) -> Optional[bytes]:
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _set_memory_limit(memory_limit: int):
+    # macOS上RLIMIT_AS无法设置或不生效, windows没有resource模块; 此时只记录日志, 只有超时限制
+    try:
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        if resource.getrlimit(resource.RLIMIT_AS)[0] != memory_limit:
+            raise ValueError(f"RLIMIT_AS is {resource.getrlimit(resource.RLIMIT_AS)[0]}")
+    except (ImportError, AttributeError, ValueError, OSError) as e:
+        logger.warning(f"parse process memory limit is not applied: {type(e).__name__}: {e}")
+
+
+def _serve(memory_limit: Optional[int]):
+    # 帧通道使用原来的stdin/stdout, parse代码中的print输出到stderr
+    requests = os.fdopen(os.dup(0), "rb")
+    responses = os.fdopen(os.dup(1), "wb")
+    os.dup2(2, 1)
+    if memory_limit:
+        _set_memory_limit(memory_limit)
+
+    from html_parser import get_soup
+    from parse_registry import parse_registry
+
+    responses.write(encode_frame({"ok": True, "ready": True}))
+    responses.flush()
+    while (header := _read_exactly(requests, FRAME_HEADER.size)) is not None:
+        (size,) = FRAME_HEADER.unpack(header)
+        request = json.loads(_read_exactly(requests, size))
+        fatal = False
+        try:
+            result = parse_registry.get_parse(request["source"])(get_soup(request["html"]))
+            # 转换为json兼容的数据, 无法序列化的对象转为字符串
+            response = {"ok": True, "result": json.loads(json.dumps(result, ensure_ascii=False, default=str))}
+        except MemoryError:
+            fatal = True
+            response = {"ok": False, "error": "MemoryError: parse exceeded the memory limit", "fatal": True}
+        except Exception as e:
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        try:
+            frame = encode_frame(response)
+        except FrameError as e:
+            frame = encode_frame({"ok": False, "error": f"FrameError: {e}"})
+        responses.write(frame)
+        responses.flush()
+        if fatal:
+            break
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--memory-limit", type=int, default=None, help="address space limit in bytes")
+    _serve(parser.parse_args().memory_limit)
@@ -0,0 +1,131 @@
+import hashlib
+import importlib.util
+import marshal
+import os
+import sys
+from collections import OrderedDict
+from types import CodeType, ModuleType
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from logs import logger
+
+# LLM生成的parse代码, 以其源码的hash为key, 只compile/exec一次;
+# 同一个worker里托管多个订阅时, trigger每次触发都直接复用已加载的module, 并用LRU限制module的数量
+PARSE_FUNCTION_NAME = "parse"
+DEFAULT_MAX_MODULES = 256
+# 设置该环境变量后, compile后的code object会被marshal到该目录, 进程重启后可跳过compile
+PARSE_CACHE_DIR_ENV = "PARSE_CODE_CACHE_DIR"
+
+
+def split_parse_codes(code: str, urls: list[str]) -> dict[str, str]:
+    # code其实是多个# {url}\n{parse function}的字符串组合, 从后往前逐个切分
+    # WriteCrawleCode生成失败的url不会出现在code中, 这里跳过;
+    # 按完整的header行匹配, 避免https://x.com匹配到https://x.com/page的header
+    sources = {}
+    code = "\n" + code
+    for url in urls[::-1]:
+        header = f"\n# {url}\n"
+        if header not in code:
+            logger.warning(f"no parse code for {url}, skip it")
+            continue
+        code, current = code.rsplit(header, maxsplit=1)
+        # header前的换行属于上一段代码, 与原来的切分结果保持一致(code_key不变)
+        code += "\n"
+        sources[url] = "\n" + current
+    return {url: sources[url] for url in urls if url in sources}
+
+
+def code_key(source: str) -> str:
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+class ParseModuleRegistry:
+    def __init__(self, max_modules: int = DEFAULT_MAX_MODULES, cache_dir: str = None):
+        self.max_modules = max_modules
+        self.cache_dir = cache_dir
+        # key -> (code object, module), 按最近使用排序
+        self._entries: OrderedDict[str, tuple[CodeType, ModuleType]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, source: str):
+        return code_key(source) in self._entries
+
+    def get_module(self, source: str) -> ModuleType:
+        key = code_key(source)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        code = self._load_code(key) or self._compile(key, source)
+        module = type(sys)(f"parse_{key[:16]}")
+        # 把parse function定义为module的function
+        exec(code, module.__dict__)
+        self._entries[key] = (code, module)
+        while len(self._entries) > self.max_modules:
+            evicted, _ = self._entries.popitem(last=False)
+            logger.debug(f"evict parse module {evicted[:16]}")
+        return module
+
+    def get_parse(self, source: str):
+        return getattr(self.get_module(source), PARSE_FUNCTION_NAME)
+
+    def load_modules(self, code: str, urls: list[str]) -> dict[str, ModuleType]:
+        return {url: self.get_module(source) for url, source in split_parse_codes(code, urls).items()}
+
+    def clear(self):
+        self._entries.clear()
+
+    def _compile(self, key: str, source: str) -> CodeType:
+        code = compile(source, f"<parse-{key[:16]}>", "exec")
+        self._dump_code(key, code)
+        return code
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{sys.implementation.cache_tag}.bin")
+
+    def _load_code(self, key: str) -> CodeType:
+        if not self.cache_dir:
+            return None
+        path = self._cache_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # marshal的格式与解释器版本相关, magic number不一致时丢弃
+        magic = importlib.util.MAGIC_NUMBER
+        if data[:len(magic)] != magic:
+            return None
+        try:
+            code = marshal.loads(data[len(magic):])
+        except (EOFError, ValueError, TypeError) as e:
+            logger.warning(f"invalid cached parse code {path}: {e}")
+            return None
+        self.disk_hits += 1
+        return code
+
+    def _dump_code(self, key: str, code: CodeType):
+        if not self.cache_dir:
+            return
+        path = self._cache_path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(importlib.util.MAGIC_NUMBER + marshal.dumps(code))
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"failed to cache parse code {path}: {e}")
+
+
+# 进程内共享的registry
+parse_registry = ParseModuleRegistry(cache_dir=os.environ.get(PARSE_CACHE_DIR_ENV))
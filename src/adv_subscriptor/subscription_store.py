@@ -0,0 +1,128 @@
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Optional
+from parse_registry import split_parse_codes
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from logs import logger
+
+# 订阅的持久化存储: 保存解析后的结构化需求、每个url的parse代码、cron表达式和上次运行的状态;
+# worker重启时直接从这里恢复所有订阅, 不需要重新走ParseSubRequirement/WriteCrawleCode的LLM流程
+DEFAULT_STORE_PATH = os.environ.get(
+    "SUBSCRIPTION_STORE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "metagpt-sample", "subscriptions.sqlite3"),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id TEXT PRIMARY KEY,
+    process TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    requirement TEXT NOT NULL DEFAULT '{}',
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    last_fire REAL,
+    last_status TEXT,
+    state TEXT
+);
+CREATE TABLE IF NOT EXISTS parse_codes (
+    sub_id TEXT NOT NULL REFERENCES subscriptions(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    code TEXT,
+    PRIMARY KEY (sub_id, position)
+);
+"""
+
+
+class StoredSubscription:
+    def __init__(self, id, urls, code, process, spec, requirement, last_fire, last_status, state):
+        self.id = id
+        self.urls = urls
+        self.code = code
+        self.process = process
+        self.spec = spec
+        self.requirement = requirement
+        self.last_fire = last_fire
+        self.last_status = last_status
+        # change_detector.dump的结果
+        self.state = state
+
+    def fields(self) -> dict:
+        # 与worker_daemon.Subscription的字段一致
+        return {
+            "id": self.id, "urls": self.urls, "code": self.code, "process": self.process,
+            "spec": self.spec, "requirement": self.requirement,
+        }
+
+
+class SubscriptionStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def save(self, sub_id: str, urls: list[str], code: str, process: str, spec: str, requirement: dict = None):
+        now = time.time()
+        # 生成失败的url没有parse代码, 也保存下来, code为NULL
+        codes = split_parse_codes(code, urls)
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO subscriptions (id, process, spec, requirement, created, updated) VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET process=excluded.process, spec=excluded.spec,"
+                " requirement=excluded.requirement, updated=excluded.updated, last_fire=NULL, last_status=NULL,"
+                " state=NULL",
+                (sub_id, process, spec, json.dumps(requirement or {}, ensure_ascii=False), now, now),
+            )
+            self.conn.execute("DELETE FROM parse_codes WHERE sub_id=?", (sub_id,))
+            self.conn.executemany(
+                "INSERT INTO parse_codes VALUES (?, ?, ?, ?)",
+                [(sub_id, i, url, codes.get(url)) for i, url in enumerate(urls)],
+            )
+
+    def delete(self, sub_id: str) -> bool:
+        with self.conn:
+            return self.conn.execute("DELETE FROM subscriptions WHERE id=?", (sub_id,)).rowcount > 0
+
+    def record_run(self, sub_id: str, fired_at: Optional[float], status: str, state: dict = None):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE subscriptions SET last_fire=COALESCE(?, last_fire), last_status=?, state=? WHERE id=?",
+                (fired_at, status, json.dumps(state, ensure_ascii=False) if state else None, sub_id),
+            )
+
+    def load_all(self) -> list[StoredSubscription]:
+        # 两次查询取出全部订阅, 数千个订阅也只需要很短的时间
+        codes: dict[str, list[tuple[str, Optional[str]]]] = {}
+        for sub_id, url, code in self.conn.execute(
+            "SELECT sub_id, url, code FROM parse_codes ORDER BY sub_id, position"
+        ):
+            codes.setdefault(sub_id, []).append((url, code))
+        subscriptions = []
+        for sub_id, process, spec, requirement, last_fire, last_status, state in self.conn.execute(
+            "SELECT id, process, spec, requirement, last_fire, last_status, state FROM subscriptions ORDER BY created"
+        ):
+            parse_codes = codes.get(sub_id, [])
+            subscriptions.append(StoredSubscription(
+                sub_id,
+                [url for url, _ in parse_codes],
+                "".join(f"# {url}{code}" for url, code in parse_codes if code is not None),
+                process,
+                spec,
+                json.loads(requirement),
+                last_fire,
+                last_status,
+                json.loads(state) if state else None,
+            ))
+        logger.info(f"loaded {len(subscriptions)} subscriptions from {self.path}")
+        return subscriptions
+
+    def close(self):
+        self.conn.close()
@@ -1,13 +1,25 @@
-from metagpt.actions.action import Action
 from metagpt.roles import Role
-from metagpt.tools.web_browser_engine import WebBrowserEngine
 from metagpt.subscription import SubscriptionRunner
+# SubscriptionRunner中Role的字段引用了Environment, 需先导入才能完成pydantic model的定义
+from metagpt.environment import Environment
 from metagpt.schema import Message
-from uuid import uuid4
-import sys
+from metagpt.logs import logger
+from parse_registry import code_key, split_parse_codes
+from parse_pool import parse_pool
+from browser_pool import browser_pool
+from adaptive_fetcher import adaptive_fetcher
+from change_detector import UNCHANGED_REUSE, UNCHANGED_SUPPRESS, change_detector, fingerprint
 import ast
 import argparse
 import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from cron_scheduler import cron_scheduler
+from llm_cache import CachedAction
+from map_reduce import MAP_PROMPT, map_reduce_summarize
+from tracing import traced_trigger, tracer
 
 # 订阅的SubAction的行为: 根据parse function执行后的结构，回答用户结构化需求中的Post Processing requirements
 TEMPLATE_SUB_ACTION="""
@@ -18,6 +30,18 @@ Answer the question based on the provided context {process}. If the question can
 {data}
 """
 
+# 只有新增记录时的增量总结: 在上次的回答基础上, 结合新增的记录更新回答
+TEMPLATE_SUB_ACTION_DELTA="""
+## Requirments
+Answer the question based on the provided context {process}. The previous answer was generated from earlier data, and the context only lists the records that are new since then. Update the previous answer with the new records. If the question can't be answered, please summarize the content.
+
+## previous answer
+{summary}
+
+## new context
+{data}
+"""
+
 
 class ExecuteSubscriptionRole(Role):
     name: str = "Conner"
@@ -26,46 +50,87 @@ class ExecuteSubscriptionRole(Role):
     def __init__(self, *args, **kwargs):
         super().__init__()
 
-class AddSubscriptionTask(Action):
+class AddSubscriptionTask(CachedAction):
     name: str = "Lao Cang"
     urls: list[str] = []
     code: str = ""
     user_requirement: str = ""
+    # 爬取结果没有变化时: reuse复用上次的总结, suppress不再推送(返回空内容)
+    unchanged_policy: str = UNCHANGED_REUSE
 
-    def __init__(self, urls: list[str], code: str, user_requirement: str):
-        super().__init__()
+    def __init__(self, urls: list[str], code: str, user_requirement: str, **kwargs):
+        super().__init__(**kwargs)
         self.urls = urls
         self.code = code
         self.user_requirement = user_requirement
 
+    @property
+    def subscription_key(self) -> str:
+        return fingerprint([self.urls, self.code, self.user_requirement])
+
     async def run(self, *args, **kwargs):
-        modules = {}
-        for url in self.urls[::-1]:
-            # code其实是多个# {url}\n{parse function}的字符串组合
-            code = self.code.rsplit(f"# {url}", maxsplit=1)[1]
-            name = uuid4().hex
-            module = type(sys)(name)
-            exec(code, module.__dict__)
-            modules[url] = module
-
-        pages = await WebBrowserEngine().run(*self.urls)
-        if len(self.urls) == 1:
-            pages = [pages]
-        data = []
-        for url, page in zip(self.urls, pages):
-            data.append(getattr(modules[url], "parse")(page.soup))
+        # code其实是多个# {url}\n{parse function}的字符串组合
+        sources = split_parse_codes(self.code, self.urls)
+        urls = list(sources)
+
+        # 优先用静态请求获取页面, 需要js渲染的页面才使用共享的浏览器;
+        # parse在子进程池中执行, 同一份代码在子进程中只会compile/exec一次;
+        # 多个订阅同时抓取同一url且parse代码相同时, 只抓取和parse一次
+        results = await asyncio.gather(*(
+            adaptive_fetcher.fetch_parse(
+                url,
+                lambda page, source=sources[url]: parse_pool.parse(source, page.html),
+                parse_key=code_key(sources[url]),
+            )
+            for url in urls
+        ))
+        data = dict(zip(urls, results))
+
+        # 与上次的parse结果比较, 没有变化时不再请求LLM, 只有新增记录时只发送新增部分
+        key = self.subscription_key
+        delta = change_detector.diff(key, data)
+        if not delta.changed:
+            logger.info(f"subscription {key}: crawled data unchanged, policy={self.unchanged_policy}")
+            if self.unchanged_policy == UNCHANGED_SUPPRESS or delta.previous_summary is None:
+                return ""
+            return delta.previous_summary
 
         # 这里似乎有bug, url和user_requirement, 应该是一一对应
         # SubAction 根据parse 抓取的内容，回答用户的Post Processing requirements
-        rsp = await self.llm.aask(TEMPLATE_SUB_ACTION.format(process=self.user_requirement, data=data))
+        if delta.incremental:
+            logger.info(f"subscription {key}: {sum(len(i) for i in delta.new_items.values())} new records")
+            rsp = await self.summarize(delta.new_items, TEMPLATE_SUB_ACTION_DELTA, summary=delta.previous_summary)
+        else:
+            rsp = await self.summarize(list(data.values()), TEMPLATE_SUB_ACTION)
+        change_detector.commit(key, data, rsp)
         return rsp
 
+    async def summarize(self, data, template: str, **kwargs) -> str:
+        # 爬取的记录超出token预算时分块总结后再合并
+        return await map_reduce_summarize(
+            self._aask,
+            data,
+            lambda records: template.format(process=self.user_requirement, data=records, **kwargs),
+            lambda chunk, index, total: MAP_PROMPT.format(
+                process=self.user_requirement, index=index, total=total, data=chunk
+            ),
+            model=getattr(self.llm, "model", None),
+        )
+
 TRIGGER_INTERVAL = 86400
-async def CronTrigger(cron_exp: str):
-    while True:
+# 同一时刻到期的订阅在该秒数内随机错开触发
+TRIGGER_JITTER = 60
+
+# 按cron表达式触发, 所有订阅共享进程内的cron_scheduler; 没有cron表达式时按TRIGGER_INTERVAL触发
+async def CronTrigger(cron_exp: str, last_fire: float = None):
+    if not cron_exp:
+        while True:
+            yield Message(content="CroneTrigger")
+            await asyncio.sleep(TRIGGER_INTERVAL)
+    async for _ in cron_scheduler.trigger(cron_exp, jitter=TRIGGER_JITTER, last_fire=last_fire):
         yield Message(content="CroneTrigger")
-        await asyncio.sleep(TRIGGER_INTERVAL)
 
+# 单个订阅的独立进程; 常驻的worker_daemon托管多个订阅, 并通过control socket推送结果
 def worker(urls, code, process, spec):
     print("worker start")
     role = ExecuteSubscriptionRole()
@@ -73,11 +138,18 @@ def worker(urls, code, process, spec):
     runner = SubscriptionRunner()
 
     async def callback(msg):
-        print("msg")
+        with tracer.span("callback"):
+            print("msg")
+        tracer.finish_run()
     
     async def run():
-        await runner.subscribe(role, CronTrigger(spec), callback)
-        await runner.run()
+        await runner.subscribe(role, traced_trigger(CronTrigger(spec), "subscription_run"), callback)
+        try:
+            await runner.run()
+        finally:
+            await adaptive_fetcher.close()
+            await parse_pool.close()
+            await browser_pool.close()
     
     loop = asyncio.get_event_loop()
     loop.run_until_complete(run())
@@ -96,9 +168,10 @@ def main():
     parser.add_argument("process", type=str, help="Post Processing requirements")
     parser.add_argument("spec", type=str, help="CronTrigger spec")
     args = parser.parse_args()
-    
+
     print(args.urls)
     worker(args.urls, args.code, args.process, args.spec)
 
-print("main start")
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    print("main start")
+    main()
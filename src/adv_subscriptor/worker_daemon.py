@@ -0,0 +1,308 @@
+import argparse
+import asyncio
+import fcntl
+import os
+import sys
+import time
+from typing import AsyncIterator
+from pydantic import BaseModel
+from metagpt.logs import logger
+from metagpt.schema import Message
+from metagpt.subscription import SubscriptionRunner
+from worker import AddSubscriptionTask, CronTrigger, ExecuteSubscriptionRole
+from browser_pool import browser_pool
+from adaptive_fetcher import adaptive_fetcher
+from parse_pool import parse_pool
+from change_detector import change_detector
+from subscription_store import DEFAULT_STORE_PATH, SubscriptionStore
+from ipc import (
+    FRAME_ERROR, FRAME_RESULT, FRAME_STATUS, STATUS_ADDED, STATUS_READY, STATUS_REMOVED,
+    encode_frame, read_frame, write_frame,
+)
+from sink_dispatcher import COALESCE, SinkDispatcher
+from tracing import tracer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "oss_watcher"))
+from osscallback import DELIVERY_TIMEOUT, wxpusher_sender
+
+# 常驻的订阅worker: 一个进程托管多个订阅, 共享同一份metagpt/浏览器/parse module;
+# 通过unix socket上的控制通道增删改订阅, 每条命令和响应都是一个长度前缀的json帧;
+# 发送watch命令的连接之后会收到推送的status/result/error帧(订阅的增删、运行结果和出错);
+# 订阅保存在SubscriptionStore中, worker重启时直接恢复, 不再请求LLM
+DEFAULT_SOCKET_PATH = os.environ.get("SUBSCRIPTION_WORKER_SOCKET", "/tmp/metagpt-subscription-worker.sock")
+# 与socket同目录的锁文件, 同一个socket只允许一个worker监听
+LOCK_SUFFIX = ".lock"
+
+
+class WorkerAlreadyRunning(RuntimeError):
+    pass
+
+
+class Subscription(BaseModel):
+    id: str
+    urls: list[str]
+    code: str
+    process: str
+    spec: str
+    # ParseSubRequirement解析出的结构化需求
+    requirement: dict = {}
+
+
+class SubscriptionWorker:
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, store: SubscriptionStore = None):
+        self.socket_path = socket_path
+        self.store = store
+        self.runner = SubscriptionRunner()
+        self.subscriptions: dict[str, tuple[Subscription, ExecuteSubscriptionRole]] = {}
+        self._server = None
+        self._stopped = None
+        self._lock_file = None
+        # watch中的客户端连接
+        self._watchers: set[asyncio.StreamWriter] = set()
+        # 订阅的结果({"id", "content"})通过dispatcher分发到各sink, callback只入队
+        self.dispatcher = SinkDispatcher()
+        self.dispatcher.add("watch", self._publish_result, key=lambda result: result["id"])
+        # 配置了wxpusher时推送给用户; 积压时同一订阅还没发出的结果被新的结果替换
+        if os.environ.get("WXPUSHER_TOKEN"):
+            self.dispatcher.add(
+                "wxpusher", self._send_wxpusher,
+                policy=COALESCE, timeout=DELIVERY_TIMEOUT, key=lambda result: result["id"],
+            )
+
+    def _acquire_lock(self):
+        # 锁在进程退出时由系统释放; 拿到锁之后残留的socket文件一定是已退出的worker留下的, 可以删除
+        lock_file = open(self.socket_path + LOCK_SUFFIX, "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.seek(0)
+            pid = lock_file.read().strip()
+            lock_file.close()
+            raise WorkerAlreadyRunning(f"subscription worker {pid} is already running on {self.socket_path}")
+        lock_file.truncate(0)
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._lock_file = lock_file
+
+    def _release_lock(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def publish(self, type: str, **fields):
+        # 推送给所有watch的客户端; 只写入transport的缓冲区, 不等待慢的客户端
+        frame = encode_frame({"type": type, **fields})
+        for writer in list(self._watchers):
+            if writer.is_closing():
+                self._watchers.discard(writer)
+                continue
+            writer.write(frame)
+
+    async def _publish_result(self, result: dict):
+        logger.info(f"subscription {result['id']}: {result['content']}")
+        self.publish(FRAME_RESULT, **result)
+
+    async def _send_wxpusher(self, result: dict):
+        await wxpusher_sender.send(result["content"])
+
+    def _on_subscription_done(self, sub_id: str, task: asyncio.Task):
+        # 订阅的task因异常结束时(如role.run出错), 通知watch的客户端
+        if not task.cancelled() and task.exception() is not None:
+            e = task.exception()
+            self.publish(FRAME_ERROR, id=sub_id, error=f"{type(e).__name__}: {e}")
+
+    async def add(self, sub: Subscription, *, last_fire: float = None, persist: bool = True):
+        if sub.id in self.subscriptions:
+            await self.remove(sub.id, persist=False)
+        if persist and self.store is not None:
+            self.store.save(sub.id, sub.urls, sub.code, sub.process, sub.spec, sub.requirement)
+        role = ExecuteSubscriptionRole()
+        task = AddSubscriptionTask(sub.urls, sub.code, sub.process)
+        role.init_actions([task])
+        fired = {"at": None}
+
+        async def trigger():
+            # last_fire之后有错过的触发时, 恢复后会立即补触发一次
+            async for msg in CronTrigger(sub.spec, last_fire=last_fire):
+                fired["at"] = time.time()
+                tracer.start_run("subscription_run", subscription=sub.id)
+                yield msg
+
+        async def callback(msg: Message):
+            with tracer.span("callback"):
+                # 运行成功后记录触发时间和变更检测的状态, 重启后可以继续增量总结
+                if self.store is not None:
+                    self.store.record_run(sub.id, fired["at"], "ok", change_detector.dump(task.subscription_key))
+                # 爬取结果没有变化且策略为suppress时, 内容为空, 不再推送
+                if msg.content:
+                    self.dispatcher.dispatch({"id": sub.id, "content": msg.content})
+            tracer.finish_run()
+
+        await self.runner.subscribe(role, trigger(), callback)
+        self.runner.tasks[role].add_done_callback(lambda done: self._on_subscription_done(sub.id, done))
+        self.subscriptions[sub.id] = (sub, role)
+        self.publish(FRAME_STATUS, id=sub.id, status=STATUS_ADDED)
+        logger.debug(f"subscription {sub.id} added, urls={sub.urls}, spec={sub.spec}")
+
+    async def remove(self, sub_id: str, *, persist: bool = True) -> bool:
+        if sub_id not in self.subscriptions:
+            return False
+        sub, role = self.subscriptions.pop(sub_id)
+        # runner.run会在task结束时自行移除, 这里只处理仍在运行的task
+        if role in self.runner.tasks:
+            await self.runner.unsubscribe(role)
+        if persist and self.store is not None:
+            self.store.delete(sub_id)
+            change_detector.forget(AddSubscriptionTask(sub.urls, sub.code, sub.process).subscription_key)
+        self.publish(FRAME_STATUS, id=sub_id, status=STATUS_REMOVED)
+        logger.debug(f"subscription {sub_id} removed")
+        return True
+
+    async def restore(self):
+        if self.store is None:
+            return
+        start = time.perf_counter()
+        for stored in self.store.load_all():
+            # 单个订阅恢复失败时只记录日志, 不影响其他订阅
+            try:
+                sub = Subscription(**stored.fields())
+                if stored.state:
+                    key = AddSubscriptionTask(sub.urls, sub.code, sub.process).subscription_key
+                    change_detector.load(key, stored.state)
+                await self.add(sub, last_fire=stored.last_fire, persist=False)
+            except Exception:
+                logger.exception(f"failed to restore subscription {stored.id}")
+        logger.info(f"restored {len(self.subscriptions)} subscriptions in {time.perf_counter() - start:.2f}s")
+
+    def list(self) -> list[dict]:
+        return [
+            {"id": sub.id, "urls": sub.urls, "spec": sub.spec, "running": role in self.runner.tasks}
+            for sub, role in self.subscriptions.values()
+        ]
+
+    async def handle_command(self, command: dict) -> dict:
+        op = command.get("op")
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid(), "subscriptions": len(self.subscriptions)}
+        if op in ("add", "update"):
+            sub = Subscription(**command["subscription"])
+            if op == "update" and sub.id not in self.subscriptions:
+                return {"ok": False, "error": f"unknown subscription {sub.id}"}
+            await self.add(sub)
+            return {"ok": True, "id": sub.id}
+        if op == "remove":
+            removed = await self.remove(command["id"])
+            return {"ok": removed} if removed else {"ok": False, "error": f"unknown subscription {command['id']}"}
+        if op == "list":
+            return {"ok": True, "subscriptions": self.list()}
+        if op == "metrics":
+            # 各阶段耗时的直方图, format为text或prometheus
+            if command.get("format") == "prometheus":
+                return {"ok": True, "metrics": tracer.render_prometheus()}
+            return {"ok": True, "metrics": tracer.render_text()}
+        if op == "shutdown":
+            self._stopped.set()
+            return {"ok": True}
+        return {"ok": False, "error": f"unknown op {op}"}
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while (command := await read_frame(reader)) is not None:
+                if command.get("op") == "watch":
+                    # 之后推送的帧都写到这个连接上, 直到客户端断开
+                    self._watchers.add(writer)
+                    response = {"ok": True, "type": FRAME_STATUS, "status": STATUS_READY, "pid": os.getpid()}
+                else:
+                    try:
+                        response = await self.handle_command(command)
+                    except Exception as e:
+                        logger.exception(f"control command failed: {str(command)[:200]}")
+                        response = {"ok": False, "error": str(e)}
+                await write_frame(writer, response)
+                if self._stopped.is_set():
+                    break
+        finally:
+            self._watchers.discard(writer)
+            writer.close()
+
+    async def serve(self):
+        # 启动方通过control socket的ping判断是否就绪
+        self._stopped = asyncio.Event()
+        try:
+            self._acquire_lock()
+            await self.restore()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self._server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        except Exception:
+            self._release_lock()
+            raise
+        logger.info(f"subscription worker {os.getpid()} listening on {self.socket_path}")
+        # 某个订阅出错时只记录日志, 不影响其他订阅
+        runner_task = asyncio.create_task(self.runner.run(raise_exception=False))
+        try:
+            await self._stopped.wait()
+        finally:
+            self._server.close()
+            runner_task.cancel()
+            # 停止时只取消运行中的订阅, 保留存储中的记录
+            for sub_id in list(self.subscriptions):
+                await self.remove(sub_id, persist=False)
+            # 投递各sink中剩余的结果之后再断开watch的客户端
+            await self.dispatcher.close()
+            logger.info(f"sinks: {self.dispatcher.stats()}")
+            for writer in list(self._watchers):
+                writer.close()
+            self._watchers.clear()
+            await self._server.wait_closed()
+            await adaptive_fetcher.close()
+            await parse_pool.close()
+            await browser_pool.close()
+            if self.store is not None:
+                self.store.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self._release_lock()
+            logger.info("subscription worker stopped")
+
+
+async def send_command(command: dict, socket_path: str = DEFAULT_SOCKET_PATH) -> dict:
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    try:
+        await write_frame(writer, command)
+        response = await read_frame(reader)
+        if response is None:
+            raise ConnectionResetError(f"subscription worker closed the connection on {socket_path}")
+        return response
+    finally:
+        writer.close()
+
+
+async def watch_worker(socket_path: str = DEFAULT_SOCKET_PATH) -> AsyncIterator[dict]:
+    # 依次返回worker推送的status/result/error帧, worker退出时结束
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    try:
+        await write_frame(writer, {"op": "watch"})
+        response = await read_frame(reader)
+        if response is None or not response.get("ok"):
+            raise ConnectionResetError(f"subscription worker refused to watch on {socket_path}: {response}")
+        while (frame := await read_frame(reader)) is not None:
+            yield frame
+    finally:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET_PATH, help="control socket path")
+    parser.add_argument("--store", type=str, default=DEFAULT_STORE_PATH, help="subscription store path")
+    args = parser.parse_args()
+    try:
+        asyncio.run(SubscriptionWorker(args.socket, SubscriptionStore(args.store)).serve())
+    except WorkerAlreadyRunning as e:
+        # 已有worker在服务, 不是错误
+        logger.info(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from datetime import datetime, timedelta, tzinfo
+from typing import AsyncIterator, Optional
+from logs import logger
+from tracing import tracer
+
+# 进程内统一的cron调度器: 解析5段式cron表达式, 用一个堆维护所有订阅的下次触发时间,
+# 只在最早的deadline唤醒; 支持停机后补触发错过的一次, 以及随机jitter打散同一时刻到期的订阅
+
+FIELD_RANGES = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 6),
+)
+MONTH_NAMES = {name: i for i, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+WEEKDAY_NAMES = {name: i for i, name in enumerate(["sun", "mon", "tue", "wed", "thu", "fri", "sat"])}
+MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+# 超过计划时间加jitter后该秒数才触发的, 视为错过(停机/休眠), 只补触发一次
+MISFIRE_GRACE = 60
+# 最长睡眠时间, 定期按墙上时间重新检查, 应对系统时间调整
+MAX_SLEEP = 300
+
+
+class CronSpec:
+    def __init__(self, spec: str):
+        self.spec = spec
+        fields = MACROS.get(spec.strip().lower(), spec).split()
+        if len(fields) != 5:
+            raise ValueError(f"invalid cron expression {spec!r}: expect 5 fields")
+        parsed = [self._parse_field(field, *limits) for field, limits in zip(fields, FIELD_RANGES)]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (sorted(i) for i in parsed)
+        # 与vixie cron一致: day和weekday都有限制时, 满足其一即可;
+        # 以*开头(如*/1)或覆盖了所有取值(如1-31, 0-7)的字段视为不限制
+        self._day_any = fields[2].startswith("*") or len(self.days) == 31
+        self._weekday_any = fields[4].startswith("*") or len(self.weekdays) == 7
+
+    def __repr__(self):
+        return f"CronSpec({self.spec!r})"
+
+    @staticmethod
+    def _parse_field(field: str, name: str, low: int, high: int) -> set[int]:
+        names = MONTH_NAMES if name == "month" else WEEKDAY_NAMES if name == "weekday" else {}
+
+        def value(text):
+            text = text.lower()
+            if text in names:
+                return names[text]
+            number = int(text)
+            # weekday的7也表示周日, 在展开范围后再映射为0, 使0-7, 5-7这样的范围保持完整
+            limit = 7 if name == "weekday" else high
+            if not low <= number <= limit:
+                raise ValueError(f"{name} value {number} out of range {low}-{limit}")
+            return number
+
+        values = set()
+        for part in field.split(","):
+            expr, _, step = part.partition("/")
+            step = int(step) if step else 1
+            if step <= 0:
+                raise ValueError(f"invalid step in {part!r}")
+            if expr == "*":
+                start, end = low, high
+            elif "-" in expr:
+                start, end = (value(i) for i in expr.split("-", 1))
+            else:
+                start = value(expr)
+                end = high if step > 1 else start
+            if name == "weekday" and end < start:
+                # 跨周日的范围, 如fri-sun即5-0
+                end += 7
+            values.update(i % 7 if name == "weekday" else i for i in range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day_ok = dt.day in self.days
+        # datetime.weekday(): 周一为0, cron中周日为0
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self._day_any or self._weekday_any:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, dt: datetime) -> datetime:
+        # dt为naive的墙上时间, 返回严格晚于dt的下一个触发时间
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t.year + 8
+        while t.year <= limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if t.hour not in self.hours:
+                hour = next((h for h in self.hours if h > t.hour), None)
+                if hour is None:
+                    t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+                else:
+                    t = t.replace(hour=hour, minute=0)
+                continue
+            minute = next((m for m in self.minutes if m >= t.minute), None)
+            if minute is None:
+                t = (t + timedelta(hours=1)).replace(minute=0)
+                continue
+            return t.replace(minute=minute)
+        raise ValueError(f"cron expression {self.spec!r} never fires")
+
+
+def _to_timestamp(dt: datetime, tz: Optional[tzinfo]) -> float:
+    if tz is None:
+        return dt.timestamp()
+    # pytz的时区需要用localize
+    if hasattr(tz, "localize"):
+        return tz.localize(dt).timestamp()
+    return dt.replace(tzinfo=tz).timestamp()
+
+
+def _from_timestamp(ts: float, tz: Optional[tzinfo]) -> datetime:
+    if tz is None:
+        return datetime.fromtimestamp(ts)
+    return datetime.fromtimestamp(ts, tz).replace(tzinfo=None)
+
+
+class CronJob:
+    _ids = itertools.count()
+
+    def __init__(self, spec: str, tz: Optional[tzinfo] = None, jitter: float = 0):
+        self.id = next(self._ids)
+        self.cron = CronSpec(spec)
+        self.tz = tz
+        self.jitter = jitter
+        self.base: float = 0        # 按cron计算的触发时间
+        self.due: float = 0         # 加上jitter后的实际触发时间
+        self.fires = 0
+        self.missed = 0
+        self.dropped = 0
+        self.cancelled = False
+        # 只保留一个待处理的触发, 消费者还在处理上一次时合并
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+    def schedule_after(self, ts: float):
+        self.base = _to_timestamp(self.cron.next_after(_from_timestamp(ts, self.tz)), self.tz)
+        self.due = self.base + (random.uniform(0, self.jitter) if self.jitter else 0)
+
+    async def wait(self) -> float:
+        # 等待下一次触发, 返回触发时刻
+        return await self._queue.get()
+
+    def _fire(self, now: float):
+        self.fires += 1
+        # 实际触发时间相对计划时间(含jitter)的延迟
+        tracer.observe("cron_fire_lag", max(now - self.due, 0))
+        try:
+            self._queue.put_nowait(now)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"cron job {self.cron.spec} is still running, skip this fire")
+
+
+class CronScheduler:
+    def __init__(self, misfire_grace: float = MISFIRE_GRACE):
+        self.misfire_grace = misfire_grace
+        self._heap: list[tuple[float, int, CronJob]] = []
+        self._jobs: dict[int, CronJob] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def add(
+        self, spec: str, *, tz: Optional[tzinfo] = None, jitter: float = 0, last_fire: Optional[float] = None
+    ) -> CronJob:
+        # last_fire为上次触发的时间戳(如进程重启前), 若其后有错过的触发, 立即补触发一次
+        job = CronJob(spec, tz=tz, jitter=jitter)
+        now = time.time()
+        job.schedule_after(last_fire if last_fire is not None else now)
+        if job.base <= now:
+            logger.info(f"cron job {spec} missed the fire at {_from_timestamp(job.base, tz)}, fire it now")
+            job.due = now
+        self._jobs[job.id] = job
+        self._push(job)
+        self._ensure_running()
+        return job
+
+    def remove(self, job: CronJob):
+        # 堆中的记录惰性删除
+        job.cancelled = True
+        self._jobs.pop(job.id, None)
+
+    async def trigger(self, spec: str, **kwargs) -> AsyncIterator[float]:
+        # 作为SubscriptionRunner的trigger使用, 订阅被取消时自动移除job
+        job = self.add(spec, **kwargs)
+        try:
+            while True:
+                yield await job.wait()
+        finally:
+            self.remove(job)
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _push(self, job: CronJob):
+        heapq.heappush(self._heap, (job.due, job.id, job))
+        if self._wakeup is not None and self._heap[0][2] is job:
+            self._wakeup.set()
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run(), name="CronScheduler")
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, job = heapq.heappop(self._heap)
+                if job.cancelled or due != job.due:
+                    continue
+                job._fire(now)
+                # jitter本身会推迟触发, 不计入错过的时间
+                if now - job.base > self.misfire_grace + job.jitter:
+                    # 进程休眠等原因错过了触发, 不逐个补触发, 从当前时间继续调度
+                    job.missed += 1
+                    job.schedule_after(now)
+                else:
+                    job.schedule_after(job.base)
+                heapq.heappush(self._heap, (job.due, job.id, job))
+            timeout = min(self._heap[0][0] - now, MAX_SLEEP) if self._heap else MAX_SLEEP
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+# 进程内共享的调度器
+cron_scheduler = CronScheduler()
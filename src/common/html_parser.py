@@ -0,0 +1,159 @@
+import os
+import re
+from typing import Iterator, Optional, Union
+from bs4 import BeautifulSoup
+
+# 可切换的html解析后端: 爬虫通过统一的select/select_one/find/find_all接口访问节点,
+# 安装了selectolax(lexbor)或lxml时使用更快的后端, 否则回退到纯python的html.parser;
+# 通过环境变量HTML_PARSER_BACKEND指定后端, 默认auto按速度选择已安装的后端;
+# outline和LLM生成的parse function固定使用html.parser(get_soup), 不受该环境变量影响
+BACKEND_ENV = "HTML_PARSER_BACKEND"
+BACKEND_SELECTOLAX = "selectolax"
+BACKEND_LXML = "lxml"
+BACKEND_HTML_PARSER = "html.parser"
+BACKENDS = (BACKEND_SELECTOLAX, BACKEND_LXML, BACKEND_HTML_PARSER)
+# 与metagpt.utils.parse_html._get_soup一致, 生成soup时去掉的标签
+IGNORED_TAGS = ("style", "script", "head", "title")
+# 已保存的订阅的parse代码是基于html.parser的树(没有隐式的<tbody>, 空白和不规范标签的处理也不同)生成和测试的,
+# 换成其他builder会让这些代码拿到不同的树
+GENERATED_CODE_BUILDER = "html.parser"
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as _SelectolaxParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser as _SelectolaxParser
+    except ImportError:
+        _SelectolaxParser = None
+
+try:
+    import lxml  # noqa: F401
+    _HAS_LXML = True
+except ImportError:
+    _HAS_LXML = False
+
+
+def available_backends() -> list[str]:
+    installed = {BACKEND_SELECTOLAX: _SelectolaxParser is not None, BACKEND_LXML: _HAS_LXML, BACKEND_HTML_PARSER: True}
+    return [name for name in BACKENDS if installed[name]]
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    backend = backend or os.environ.get(BACKEND_ENV) or "auto"
+    available = available_backends()
+    if backend == "auto":
+        return available[0]
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown html parser backend {backend!r}, expect one of {BACKENDS}")
+    if backend not in available:
+        raise ValueError(f"html parser backend {backend!r} is not installed")
+    return backend
+
+
+def soup_builder(backend: Optional[str] = None) -> str:
+    # BeautifulSoup使用的tree builder; selectolax不能生成bs4的树, 此时使用lxml或html.parser
+    backend = resolve_backend(backend)
+    if backend == BACKEND_SELECTOLAX:
+        return BACKEND_LXML if _HAS_LXML else BACKEND_HTML_PARSER
+    return backend
+
+
+def get_soup(html: str, backend: Optional[str] = None) -> BeautifulSoup:
+    # 需要完整bs4树的地方(outline, LLM生成的parse function)使用; 行为与_get_soup一致;
+    # 默认固定使用GENERATED_CODE_BUILDER, 只有显式指定backend时(如benchmark)才切换builder
+    builder = soup_builder(backend) if backend else GENERATED_CODE_BUILDER
+    soup = BeautifulSoup(html, builder)
+    for element in soup(IGNORED_TAGS):
+        element.extract()
+    return soup
+
+
+def _match(value: Optional[str], expected) -> bool:
+    if expected is True:
+        return value is not None
+    if value is None:
+        return False
+    if isinstance(expected, re.Pattern):
+        return expected.search(value) is not None
+    return value == expected
+
+
+class SelectolaxNode:
+    # 把selectolax的Node包装成爬虫用到的bs4 Tag接口
+    __slots__ = ("node",)
+
+    def __init__(self, node):
+        self.node = node
+
+    def __repr__(self):
+        return f"SelectolaxNode({self.node.tag})"
+
+    def __bool__(self):
+        return True
+
+    @property
+    def name(self) -> str:
+        return self.node.tag
+
+    @property
+    def text(self) -> str:
+        return self.node.text(deep=True)
+
+    def get_text(self, separator: str = "", strip: bool = False) -> str:
+        return self.node.text(deep=True, separator=separator, strip=strip)
+
+    @property
+    def attrs(self) -> dict:
+        attrs = dict(self.node.attributes)
+        if attrs.get("class") is not None:
+            attrs["class"] = attrs["class"].split()
+        return attrs
+
+    def get(self, key: str, default=None):
+        return self.attrs.get(key, default)
+
+    def __getitem__(self, key: str):
+        value = self.attrs.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def _css(self, selector: str) -> Iterator:
+        # lexbor的css匹配包含节点自身, bs4的select只匹配子孙节点
+        own = self.node.mem_id
+        return (node for node in self.node.css(selector) if node.mem_id != own)
+
+    def select(self, selector: str) -> list["SelectolaxNode"]:
+        return [SelectolaxNode(node) for node in self._css(selector)]
+
+    def select_one(self, selector: str) -> Optional["SelectolaxNode"]:
+        node = next(self._css(selector), None)
+        return SelectolaxNode(node) if node is not None else None
+
+    def _iter_find(self, name: Optional[str], class_: Optional[str], attrs: dict) -> Iterator["SelectolaxNode"]:
+        # 只支持爬虫用到的子集: 标签名, 单个class, 属性值为字符串/正则/True
+        selector = name or "*"
+        if isinstance(class_, str):
+            selector += "".join(f".{cls}" for cls in class_.split())
+        for node in self._css(selector):
+            node_attrs = node.attributes
+            if all(_match(node_attrs.get(key), expected) for key, expected in attrs.items()):
+                yield SelectolaxNode(node)
+
+    def find_all(self, name: Optional[str] = None, class_: Optional[str] = None, **attrs) -> list["SelectolaxNode"]:
+        return list(self._iter_find(name, class_, attrs))
+
+    def find(self, name: Optional[str] = None, class_: Optional[str] = None, **attrs) -> Optional["SelectolaxNode"]:
+        return next(self._iter_find(name, class_, attrs), None)
+
+
+Document = Union[BeautifulSoup, SelectolaxNode]
+
+
+def parse_document(html: str, backend: Optional[str] = None) -> Document:
+    # 返回支持select/select_one/find/find_all/text/[attr]的根节点
+    backend = resolve_backend(backend)
+    if backend == BACKEND_SELECTOLAX:
+        tree = _SelectolaxParser(html)
+        return SelectolaxNode(tree.root if tree.root is not None else tree.body)
+    return BeautifulSoup(html, backend)
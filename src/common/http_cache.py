@@ -0,0 +1,230 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+# 爬虫GET请求的磁盘缓存: 响应体用zlib压缩后存储在本地sqlite中, 按Cache-Control/Expires判断是否新鲜,
+# 过期后带If-None-Match/If-Modified-Since重新验证, 服务端返回304时直接使用缓存; 总大小超出上限时按LRU淘汰.
+# 缓存的key由url和请求头组成: 固定包含KEY_HEADERS, 以及响应的Vary中列出的请求头, 不同UA/语言的请求不共用缓存;
+# sqlite和zlib都是阻塞调用, 在async代码中通过asyncio.to_thread调用, 连接由锁保护
+DEFAULT_CACHE_PATH = os.environ.get(
+    "HTTP_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "metagpt-sample", "http_cache.sqlite3")
+)
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024  # 压缩后的大小
+COMPRESS_LEVEL = 6
+# 每写入多少条检查一次淘汰
+PRUNE_INTERVAL = 50
+CACHE_CONTROL_RE = re.compile(r"\s*([\w-]+)\s*(?:=\s*\"?([^\",]*)\"?)?\s*(?:,|$)")
+# 始终计入缓存key的请求头(小写)
+KEY_HEADERS = ("user-agent", "accept-language")
+
+
+def parse_cache_control(value: str) -> dict:
+    return {name.lower(): arg for name, arg in CACHE_CONTROL_RE.findall(value or "") if name}
+
+
+def _parse_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_vary(value: Optional[str]) -> list:
+    return sorted({name.strip().lower() for name in (value or "").split(",") if name.strip()})
+
+
+def cache_key(url: str, request_headers: Optional[Mapping[str, str]], vary: list = ()) -> str:
+    headers = {name.lower(): value for name, value in (request_headers or {}).items()}
+    names = sorted(set(KEY_HEADERS) | set(vary))
+    return "\n".join([url] + [f"{name}: {headers.get(name, '')}" for name in names])
+
+
+def fresh_until(headers: Mapping[str, str], now: float) -> Optional[float]:
+    # 返回响应新鲜的截止时间; 返回None表示不能缓存(no-store), 返回now表示每次都要重新验证
+    directives = parse_cache_control(headers.get("Cache-Control", ""))
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return now
+    if directives.get("max-age", "").isdigit():
+        age = headers.get("Age", "")
+        return now + int(directives["max-age"]) - (int(age) if age.isdigit() else 0)
+    expires = _parse_date(headers.get("Expires"))
+    if expires is not None:
+        # 按服务端的Date修正本地时钟的偏差
+        date = _parse_date(headers.get("Date"))
+        return now + expires - date if date is not None else expires
+    return now
+
+
+class CachedResponse:
+    __slots__ = ("key", "url", "text", "etag", "last_modified", "expires")
+
+    def __init__(
+        self, key: str, url: str, text: str, etag: Optional[str], last_modified: Optional[str], expires: float
+    ):
+        self.key = key
+        self.url = url
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires
+
+    def conditional_headers(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: Optional[int] = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        # fresh: 未请求网络; revalidated: 304; misses: 下载了完整的响应体
+        self.fresh_hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._writes = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(http_cache)")]
+            if columns and "key" not in columns:
+                # 旧版本按url存储的缓存, 直接丢弃
+                self._conn.execute("DROP TABLE http_cache")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS http_cache ("
+                " key TEXT PRIMARY KEY, url TEXT, body BLOB, size INTEGER, etag TEXT, last_modified TEXT,"
+                " expires REAL, stored REAL, accessed REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS http_cache_accessed ON http_cache(accessed)")
+            # 每个url最近一次响应的Vary, 查询前用来确定key中要包含哪些请求头
+            self._conn.execute("CREATE TABLE IF NOT EXISTS http_cache_vary (url TEXT PRIMARY KEY, vary TEXT)")
+        return self._conn
+
+    def _vary(self, url: str) -> list:
+        row = self.conn.execute("SELECT vary FROM http_cache_vary WHERE url=?", (url,)).fetchone()
+        return row[0].split(",") if row and row[0] else []
+
+    def get(self, url: str, request_headers: Optional[Mapping[str, str]] = None) -> Optional[CachedResponse]:
+        with self._lock:
+            key = cache_key(url, request_headers, self._vary(url))
+            row = self.conn.execute(
+                "SELECT body, etag, last_modified, expires FROM http_cache WHERE key=?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE http_cache SET accessed=? WHERE key=?", (time.time(), key))
+            self.conn.commit()
+        return CachedResponse(key, url, zlib.decompress(row[0]).decode("utf-8"), row[1], row[2], row[3])
+
+    def set(
+        self,
+        url: str,
+        headers: Mapping[str, str],
+        text: str,
+        request_headers: Optional[Mapping[str, str]] = None,
+    ):
+        # headers是响应头, request_headers是发出请求时的请求头(不含条件请求头)
+        now = time.time()
+        expires = fresh_until(headers, now)
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        vary = parse_vary(headers.get("Vary"))
+        with self._lock:
+            key = cache_key(url, request_headers, vary)
+            # 不能缓存, 或已过期又没有验证器(无法得到304)的响应不存储; Vary: *的响应无法按请求头匹配, 也不存储
+            if "*" in vary or expires is None or (expires <= now and not etag and not last_modified):
+                self.conn.execute("DELETE FROM http_cache WHERE key=?", (key,))
+                self.conn.commit()
+                return
+            self.conn.execute("INSERT OR REPLACE INTO http_cache_vary VALUES (?, ?)", (url, ",".join(vary)))
+        body = zlib.compress(text.encode("utf-8"), COMPRESS_LEVEL)
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO http_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, body, len(body), etag, last_modified, expires, now, now),
+            )
+            self.conn.commit()
+            self._writes += 1
+            if self._writes % PRUNE_INTERVAL == 0:
+                self.prune()
+
+    def revalidate(self, key: str, headers: Mapping[str, str]):
+        # 304响应: 按新的响应头更新新鲜度和验证器, 响应体不变; key为CachedResponse.key
+        now = time.time()
+        expires = fresh_until(headers, now)
+        with self._lock:
+            self.conn.execute(
+                "UPDATE http_cache SET expires=?, etag=COALESCE(?, etag),"
+                " last_modified=COALESCE(?, last_modified), accessed=? WHERE key=?",
+                (expires if expires is not None else now, headers.get("ETag"), headers.get("Last-Modified"), now, key),
+            )
+            self.conn.commit()
+
+    def prune(self):
+        if not self.max_bytes:
+            return
+        with self._lock:
+            conn = self.conn
+            # 从最久未访问的开始删除, 直到总大小不超过max_bytes
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM http_cache").fetchone()[0]
+            if total > self.max_bytes:
+                excess, keys = total - self.max_bytes, []
+                for key, size in conn.execute("SELECT key, size FROM http_cache ORDER BY accessed"):
+                    if excess <= 0:
+                        break
+                    keys.append((key,))
+                    excess -= size
+                conn.executemany("DELETE FROM http_cache WHERE key=?", keys)
+            conn.execute("DELETE FROM http_cache_vary WHERE url NOT IN (SELECT url FROM http_cache)")
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM http_cache")
+            self.conn.execute("DELETE FROM http_cache_vary")
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM http_cache"
+            ).fetchone()
+        return {
+            "fresh_hits": self.fresh_hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# 进程内共享的缓存
+http_cache = HttpCache()
@@ -0,0 +1,136 @@
+import asyncio
+import os
+from typing import Any, Optional
+from urllib.parse import urlsplit
+import aiohttp
+from metagpt.config import CONFIG
+from metagpt.logs import logger
+from http_cache import HttpCache, http_cache
+
+# 进程内共享的aiohttp session: 爬虫和推送共用一个带连接池的connector, 按host复用keep-alive连接并缓存DNS,
+# 不再为每个url/每条消息重新建立TCP/TLS连接; 代理在创建时配置一次(CONFIG.GLOBAL_PROXY), 默认直连,
+# 需要代理的请求传use_proxy=True;
+# get_text经过磁盘的http_cache, 设置环境变量HTTP_CACHE=0可关闭
+DEFAULT_LIMIT = int(os.environ.get("HTTP_POOL_LIMIT", 100))
+DEFAULT_LIMIT_PER_HOST = int(os.environ.get("HTTP_POOL_LIMIT_PER_HOST", 10))
+DNS_CACHE_TTL = 300  # s
+KEEPALIVE_TIMEOUT = 60  # s
+DEFAULT_TIMEOUT = 30  # s
+
+
+class HttpSessionManager:
+    def __init__(
+        self,
+        limit: int = DEFAULT_LIMIT,
+        limit_per_host: int = DEFAULT_LIMIT_PER_HOST,
+        dns_cache_ttl: int = DNS_CACHE_TTL,
+        keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+        timeout: float = DEFAULT_TIMEOUT,
+        proxy: Optional[str] = None,
+        cache: Optional[HttpCache] = None,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        # use_proxy=True的请求使用的代理, 其他请求直连; 单个请求的proxy参数优先
+        self.proxy = proxy
+        self.cache = cache
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def session(self) -> aiohttp.ClientSession:
+        # 连接池绑定在event loop上, 在新的loop中(如多次asyncio.run)使用时重新创建
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._loop is not loop:
+            self._discard_session()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._loop = loop
+            logger.debug(f"http session created, limit={self.limit}, limit_per_host={self.limit_per_host}")
+        return self._session
+
+    def _discard_session(self):
+        # 旧的session绑定在之前的loop上, 不能在当前loop中await close
+        session, old_loop = self._session, self._loop
+        self._session = None
+        if old_loop is not None and old_loop.is_running():
+            # 如另一个线程中仍在运行的loop, 在它上面关闭
+            asyncio.run_coroutine_threadsafe(session.close(), old_loop)
+        else:
+            logger.warning(
+                "http session of a finished event loop was not closed, its connections are leaked; "
+                "await http_sessions.close() before the loop ends"
+            )
+
+    def request(self, method: str, url: str, **kwargs):
+        # 返回aiohttp的请求上下文, 用法同session.request; use_proxy=True时使用配置的代理, 否则直连
+        if kwargs.pop("use_proxy", False) and self.proxy:
+            kwargs.setdefault("proxy", self.proxy)
+        if isinstance(kwargs.get("timeout"), (int, float)):
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=kwargs["timeout"])
+        return self.session().request(method, url, **kwargs)
+
+    async def get_text(self, url: str, use_cache: bool = True, **kwargs) -> str:
+        # 缓存按url和请求头(User-Agent/Accept-Language/Vary)区分; sqlite和zlib的阻塞调用放到线程中执行
+        cache = self.cache if use_cache else None
+        request_headers = kwargs.get("headers") or {}
+        cached = await asyncio.to_thread(cache.get, url, request_headers) if cache is not None else None
+        if cached is not None:
+            if cached.fresh:
+                cache.fresh_hits += 1
+                return cached.text
+            kwargs["headers"] = {**request_headers, **cached.conditional_headers()}
+        async with self.request("GET", url, **kwargs) as response:
+            if response.status == 304 and cached is not None:
+                cache.revalidated += 1
+                await asyncio.to_thread(cache.revalidate, cached.key, response.headers)
+                return cached.text
+            response.raise_for_status()
+            text = await response.text()
+        if cache is not None:
+            cache.misses += 1
+            await asyncio.to_thread(cache.set, url, response.headers, text, request_headers)
+        return text
+
+    async def request_json(self, method: str, url: str, **kwargs) -> Any:
+        async with self.request(method, url, **kwargs) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def close(self):
+        session, self._session = self._session, None
+        if session is not None and not session.closed:
+            await session.close()
+            # 等待底层的ssl连接关闭, 避免退出时的unclosed transport警告
+            await asyncio.sleep(0.25)
+
+
+class HostRateLimiter:
+    # 按host限制请求速率: 同一host的相邻请求至少间隔1/rate秒, 超出的请求排队等待各自的时间片
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next: dict[str, float] = {}
+
+    async def wait(self, url: str):
+        host = urlsplit(url).netloc
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next.get(host, now))
+        self._next[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+# 进程内共享的连接池
+http_sessions = HttpSessionManager(
+    proxy=CONFIG.GLOBAL_PROXY or None, cache=http_cache if os.environ.get("HTTP_CACHE", "1") != "0" else None
+)
@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from metagpt.actions import Action
+from metagpt.logs import logger
+from tracing import tracer
+
+# Action级别的LLM响应缓存: 以(model, system prompt, prompt)的hash为key, 存储在本地sqlite中,
+# 支持TTL和按条数/大小的LRU淘汰; 重跑、测试时相同的prompt不再请求LLM;
+# 响应在调用方解析成功后才写入缓存, 解析失败的响应不写入, 重试时不读缓存;
+# sqlite是阻塞调用, 在async代码中通过asyncio.to_thread调用, 连接由锁保护
+DEFAULT_CACHE_PATH = os.environ.get(
+    "LLM_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "metagpt-sample", "llm_cache.sqlite3")
+)
+DEFAULT_TTL = 7 * 86400
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# 每写入多少条检查一次淘汰
+PRUNE_INTERVAL = 100
+
+
+class LLMCache:
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        ttl: Optional[float] = DEFAULT_TTL,
+        max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+        max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # 命中时省下的LLM请求耗时(按写入缓存时记录的耗时累计)
+        self.saved_seconds = 0.0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._writes = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER,"
+                " elapsed REAL, created REAL, accessed REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache(accessed)")
+        return self._conn
+
+    @staticmethod
+    def make_key(model: str, system_msgs: Optional[list[str]], prompt: str) -> str:
+        text = json.dumps([model, system_msgs or [], prompt], ensure_ascii=False)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT response, elapsed, created FROM llm_cache WHERE key=?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl and now - row[2] > self.ttl:
+                self.conn.execute("DELETE FROM llm_cache WHERE key=?", (key,))
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += row[1] or 0
+            self.conn.execute("UPDATE llm_cache SET accessed=? WHERE key=?", (now, key))
+            self.conn.commit()
+        return row[0]
+
+    def set(self, key: str, model: str, response: str, elapsed: float = 0):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8")), elapsed, now, now),
+            )
+            self.conn.commit()
+            self._writes += 1
+            if self._writes % PRUNE_INTERVAL == 0:
+                self.prune()
+
+    def delete(self, key: str):
+        with self._lock:
+            self.conn.execute("DELETE FROM llm_cache WHERE key=?", (key,))
+            self.conn.commit()
+
+    def prune(self):
+        with self._lock:
+            conn = self.conn
+            if self.ttl:
+                conn.execute("DELETE FROM llm_cache WHERE created < ?", (time.time() - self.ttl,))
+            if self.max_entries:
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    " SELECT key FROM llm_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            if self.max_bytes:
+                # 从最久未访问的开始删除, 直到总大小不超过max_bytes
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+                if total > self.max_bytes:
+                    excess, keys = total - self.max_bytes, []
+                    for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed"):
+                        if excess <= 0:
+                            break
+                        keys.append((key,))
+                        excess -= size
+                    conn.executemany("DELETE FROM llm_cache WHERE key=?", keys)
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM llm_cache")
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        with self._lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class CachedLLM:
+    # 包装LLM, 只拦截aask, 其余属性透传; 可传给ActionNode.fill等直接使用llm的地方.
+    # 作为async context manager使用: 正常退出时写入暂存的响应, 抛出异常(解析/校验失败)时丢弃暂存的响应;
+    # 同一个实例上重复的prompt视为重试(如ActionNode.fill的tenacity重试), 不读缓存
+    def __init__(self, llm, cache: Optional[LLMCache]):
+        self._llm = llm
+        self._cache = cache
+        self._asked: set[str] = set()
+        self._pending: dict[str, tuple[str, float]] = {}
+        # 本实例写入缓存的key
+        self._written: set[str] = set()
+
+    def __getattr__(self, name):
+        return getattr(self._llm, name)
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self._llm, "model", None) or type(self._llm).__name__
+
+    async def aask(self, msg: str, system_msgs: Optional[list[str]] = None, *args, **kwargs) -> str:
+        if self._cache is None:
+            with tracer.span("llm", cache="off"):
+                return await self._llm.aask(msg, system_msgs, *args, **kwargs)
+        # 未指定system_msgs时, LLM使用其默认的system prompt
+        system = system_msgs or [getattr(self._llm, "system_prompt", "")]
+        key = self._cache.make_key(self.model_name, system, msg)
+        retry = key in self._asked
+        self._asked.add(key)
+        with tracer.span("llm", cache="retry" if retry else "hit") as span:
+            rsp = None if retry else await asyncio.to_thread(self._cache.get, key)
+            if rsp is not None:
+                logger.debug(f"llm cache hit {key[:16]}")
+                return rsp
+            if not retry:
+                span.set(cache="miss")
+            start = time.perf_counter()
+            rsp = await self._llm.aask(msg, system_msgs, *args, **kwargs)
+        if rsp:
+            self._pending[key] = (rsp, time.perf_counter() - start)
+        return rsp
+
+    async def commit(self):
+        pending, self._pending = self._pending, {}
+        if self._cache is None:
+            return
+        for key, (rsp, elapsed) in pending.items():
+            await asyncio.to_thread(self._cache.set, key, self.model_name, rsp, elapsed)
+            self._written.add(key)
+
+    async def discard(self):
+        # 也可以在with内手动调用, 如解析失败但不抛出异常时; 只删除本实例写入的响应, 之前命中的缓存不受影响
+        self._pending.clear()
+        written, self._written = self._written, set()
+        if self._cache is None:
+            return
+        for key in written:
+            await asyncio.to_thread(self._cache.delete, key)
+
+    async def __aenter__(self) -> "CachedLLM":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await (self.commit() if exc_type is None else self.discard())
+        return False
+
+
+# 进程内共享的缓存
+llm_cache = LLMCache()
+
+
+class CachedAction(Action):
+    # 设为False可关闭单个Action(类或实例)的缓存
+    use_llm_cache: bool = True
+
+    @property
+    def cached_llm(self) -> CachedLLM:
+        # 每次返回新的实例, 用async with包住一次完整的请求和解析, 如
+        # async with self.cached_llm as llm: node = await NODE.fill(context=context, llm=llm)
+        return CachedLLM(self.llm, llm_cache if self.use_llm_cache else None)
+
+    async def _aask(self, prompt: str, system_msgs: Optional[list[str]] = None) -> str:
+        # 不需要解析的响应直接写入缓存; 需要解析的, 用cached_llm在解析成功后写入
+        async with self.cached_llm as llm:
+            return await llm.aask(prompt, system_msgs)
@@ -0,0 +1,8 @@
+# 不依赖LLM的模块(cron/tracing/sink/订阅存储等)使用的logger: 与metagpt共用同一个logger;
+# 没有安装metagpt时(如只运行单元测试)退回到标准库的logging, 这些模块可以单独导入
+try:
+    from metagpt.logs import logger
+except ImportError:
+    import logging
+
+    logger = logging.getLogger("metagpt-sample")
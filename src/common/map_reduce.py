@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Optional
+import tiktoken
+from metagpt.config import CONFIG
+from metagpt.logs import logger
+from metagpt.utils.token_counter import TOKEN_MAX
+
+# 超出token预算的爬取结果的map-reduce总结: 按token预算把记录分块, 有限并发地分别总结(map),
+# 再把各块的总结合并为最终回答(reduce); 能放进一个prompt时仍然只请求一次LLM
+# prompt的预算 = 模型的上下文窗口 - 预留给响应的token(max_tokens_rsp) - system prompt和消息格式的开销
+DEFAULT_CONTEXT_TOKENS = 4096
+PROMPT_OVERHEAD = 128
+MIN_PROMPT_TOKENS = 512
+DEFAULT_CONCURRENCY = 4
+DEFAULT_ENCODING = "cl100k_base"
+# 单条记录超出预算时截断, 并加上该标记
+TRUNCATED_MARK = " ...[truncated]"
+# count_tokens缓存的条数, 以文本的hash为key, 不持有文本本身
+TOKEN_CACHE_SIZE = 16384
+
+MAP_PROMPT = """
+## Requirments
+The context is part {index} of {total} of the crawled records. Extract the information that is relevant to the question: {process}. Keep names, links, numbers and dates. Do not answer the question yet.
+
+## context
+{data}
+"""
+
+
+def prompt_budget(model: Optional[str] = None) -> int:
+    window = TOKEN_MAX.get(model or CONFIG.openai_api_model, DEFAULT_CONTEXT_TOKENS)
+    return max(window - int(CONFIG.max_tokens_rsp or 0) - PROMPT_OVERHEAD, MIN_PROMPT_TOKENS)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: Optional[str] = None):
+    if model:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            pass
+    return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+def token_length(text: str, model: Optional[str] = None) -> int:
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+
+_token_counts: "OrderedDict[tuple[bytes, Optional[str]], int]" = OrderedDict()
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    # 同一条记录/模板每次订阅触发都会重新计算, 缓存结果(LRU); 完整的prompt不缓存
+    key = (hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest(), model)
+    count = _token_counts.get(key)
+    if count is not None:
+        _token_counts.move_to_end(key)
+        return count
+    count = _token_counts[key] = token_length(text, model)
+    if len(_token_counts) > TOKEN_CACHE_SIZE:
+        _token_counts.popitem(last=False)
+    return count
+
+
+def record_text(record: Any) -> str:
+    if isinstance(record, str):
+        return record
+    return json.dumps(record, ensure_ascii=False, default=str)
+
+
+def truncate_tokens(text: str, budget: int, model: Optional[str] = None) -> str:
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= budget:
+        return text
+    return encoding.decode(tokens[:max(budget - count_tokens(TRUNCATED_MARK, model), 0)]) + TRUNCATED_MARK
+
+
+def chunk_records(records: list, budget: int, model: Optional[str] = None) -> list[list]:
+    # 按顺序贪心地把记录放入块中, 每块记录的token数之和不超过budget
+    chunks, current, used = [], [], 0
+    for record in records:
+        text = record_text(record)
+        # 每条记录在列表中还有分隔符等开销, 按1个token估计
+        tokens = count_tokens(text, model) + 1
+        if tokens > budget:
+            record, tokens = truncate_tokens(text, budget - 1, model), budget
+        if current and used + tokens > budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(record)
+        used += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def flatten_records(data: Any) -> list:
+    # 各url的parse结果(dict/list)展开为一条条记录
+    if isinstance(data, dict):
+        return [item for value in data.values() for item in flatten_records(value)]
+    if isinstance(data, (list, tuple)):
+        return [item for value in data for item in (value if isinstance(value, (list, tuple)) else [value])]
+    return [data]
+
+
+class MapReduceSummarizer:
+    def __init__(
+        self,
+        ask: Callable[[str], Awaitable[str]],
+        render: Callable[[list], str],
+        map_prompt: Callable[[list, int, int], str],
+        *,
+        budget: Optional[int] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        model: Optional[str] = None,
+    ):
+        # render(records): 直接回答的完整prompt, 也用于reduce阶段(records为各块的总结)
+        # map_prompt(chunk, index, total): 总结单个块的prompt
+        # budget: 完整prompt的token上限, 默认按模型的上下文窗口计算
+        self.ask = ask
+        self.render = render
+        self.map_prompt = map_prompt
+        self.budget = budget or prompt_budget(model)
+        self.concurrency = concurrency
+        self.model = model
+
+    def fits(self, records: list) -> bool:
+        return token_length(self.render(records), self.model) <= self.budget
+
+    async def run(self, records: list) -> str:
+        level = 0
+        while not self.fits(records):
+            overhead = count_tokens(self.map_prompt([], 0, 0), self.model)
+            chunks = chunk_records(records, max(self.budget - overhead, 1), self.model)
+            if level and len(chunks) >= len(records):
+                # 每条总结都无法再合并, 直接reduce, 避免无限循环
+                logger.warning("map-reduce summaries can not be merged any further, reduce them as they are")
+                break
+            logger.info(f"map-reduce level {level}: {len(records)} records -> {len(chunks)} chunks")
+            records = await self._map(chunks)
+            level += 1
+        return await self.ask(self.render(records))
+
+    async def _map(self, chunks: list[list]) -> list[str]:
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def summarize(index: int, chunk: list) -> str:
+            async with limit:
+                return await self.ask(self.map_prompt(chunk, index + 1, len(chunks)))
+
+        return list(await asyncio.gather(*(summarize(i, chunk) for i, chunk in enumerate(chunks))))
+
+
+async def map_reduce_summarize(
+    ask: Callable[[str], Awaitable[str]],
+    data: Any,
+    render: Callable[[Any], str],
+    map_prompt: Callable[[list, int, int], str],
+    **kwargs,
+) -> str:
+    # data能放进一个prompt时, 与原来一样直接请求一次; 否则展开为记录后map-reduce
+    summarizer = MapReduceSummarizer(ask, render, map_prompt, **kwargs)
+    if summarizer.fits(data):
+        return await ask(render(data))
+    return await summarizer.run(flatten_records(data))
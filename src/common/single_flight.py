@@ -0,0 +1,44 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+from tracing import tracer
+
+# 相同请求的合并(single-flight): 同一个key同时只执行一次, 执行期间到来的调用等待同一个task, 得到同一个结果对象(不复制);
+# 多个订阅在同一分钟抓取同一个url时, 对网站的请求和parse的CPU开销不随订阅数增加; 调用方不应修改共享的结果.
+# 共享的task复制的是发起调用方的context, 其中的span(fetch/parse/...)只计入发起方的run;
+# 等待的调用方只记录一个shared span, 即等待共享结果的耗时
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task] = {}
+        # 执行的次数, 以及合并到已有执行上的调用次数
+        self.executed = 0
+        self.shared = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            # 在独立的task中执行, 发起的调用方被取消时不影响其他等待的调用方
+            task = asyncio.get_running_loop().create_task(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.executed += 1
+            return await asyncio.shield(task)
+        self.shared += 1
+        with tracer.span("shared"):
+            return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        # 执行结束后移除, 之后的调用(包括失败后的重试)会重新执行
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # 所有调用方都已取消时, 避免"exception was never retrieved"的警告
+            task.exception()
+
+
+# 进程内共享
+single_flight = SingleFlight()
@@ -0,0 +1,175 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable, Optional
+from logs import logger
+from tracing import tracer
+
+# SubscriptionRunner的callback只把结果放入各个sink(wxpusher/打印/...)的有界队列后立即返回, 每个sink在自己的task中消费:
+# 慢的sink不阻塞订阅和其他sink, 单个sink失败或超时只记录日志和计数; 队列满时按策略丢弃或合并, 各sink的计数可通过stats查看
+DEFAULT_MAXSIZE = 16
+DEFAULT_TIMEOUT = 60  # s, 单条消息的投递超时
+# 退出时等待各sink投递剩余消息的最长时间
+DRAIN_TIMEOUT = 30  # s
+# 队列满时的策略
+DROP_OLDEST = "drop_oldest"  # 丢弃最早的消息, 保留新的结果
+DROP_NEWEST = "drop_newest"  # 丢弃新到的消息
+COALESCE = "coalesce"  # 队列中已有相同key的消息时, 用新消息替换它; 队列满时丢弃最早的消息
+POLICIES = (DROP_OLDEST, DROP_NEWEST, COALESCE)
+
+
+def message_key(msg: Any) -> Hashable:
+    # 默认按产生消息的action合并, 同一个role的新结果覆盖还没发出去的旧结果
+    return getattr(msg, "cause_by", None)
+
+
+class Sink:
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Any], Awaitable[Any]],
+        maxsize: int = DEFAULT_MAXSIZE,
+        timeout: Optional[float] = DEFAULT_TIMEOUT,
+        policy: str = DROP_OLDEST,
+        key: Callable[[Any], Hashable] = message_key,
+        on_discard: Optional[Callable[[Any], Any]] = None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown policy {policy}, expected one of {POLICIES}")
+        self.name = name
+        self.func = func
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.policy = policy
+        self.key = key
+        # 消息被丢弃或被合并替换(不会再投递)时调用, 用于释放与消息关联的状态
+        self.on_discard = on_discard
+        # (入队时间, 消息)
+        self.queue: deque = deque()
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.high_watermark = 0
+        self._ready: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_worker(self):
+        # 事件和task绑定在event loop上
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._ready, self._idle = asyncio.Event(), asyncio.Event()
+            self._idle.set()
+            self._loop = loop
+            self._worker = None
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+    def offer(self, msg: Any):
+        self._ensure_worker()
+        self.enqueued += 1
+        item = (time.perf_counter(), msg)
+        if self.policy == COALESCE:
+            key = self.key(msg)
+            for i, (_, queued) in enumerate(self.queue):
+                if self.key(queued) == key:
+                    self.queue[i] = item
+                    self.coalesced += 1
+                    self._discard(queued)
+                    return
+        if len(self.queue) >= self.maxsize:
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                logger.warning(f"sink {self.name} is full, dropped the new message")
+                self._discard(msg)
+                return
+            self._discard(self.queue.popleft()[1])
+            logger.warning(f"sink {self.name} is full, dropped the oldest message")
+        self.queue.append(item)
+        self.high_watermark = max(self.high_watermark, len(self.queue))
+        self._idle.clear()
+        self._ready.set()
+
+    def _discard(self, msg: Any):
+        if self.on_discard is not None:
+            try:
+                self.on_discard(msg)
+            except Exception as e:
+                logger.warning(f"sink {self.name} on_discard failed: {e!r}")
+
+    async def _run(self):
+        while True:
+            if not self.queue:
+                self._idle.set()
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            queued_at, msg = self.queue.popleft()
+            tracer.observe("sink_queue_wait", time.perf_counter() - queued_at, sink=self.name)
+            try:
+                with tracer.span("sink", sink=self.name):
+                    await asyncio.wait_for(self.func(msg), self.timeout)
+                self.delivered += 1
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                logger.warning(f"sink {self.name} timed out after {self.timeout}s")
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"sink {self.name} failed: {e!r}")
+
+    async def drain(self, timeout: Optional[float] = DRAIN_TIMEOUT):
+        if self._loop is not asyncio.get_running_loop():
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"sink {self.name} drain timed out, {len(self.queue)} messages not delivered")
+
+    async def close(self, timeout: Optional[float] = DRAIN_TIMEOUT):
+        await self.drain(timeout)
+        worker, self._worker = self._worker, None
+        if worker is not None and not worker.done():
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self.queue),
+            "high_watermark": self.high_watermark,
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+
+class SinkDispatcher:
+    def __init__(self):
+        self.sinks: dict[str, Sink] = {}
+
+    def add(self, name: str, func: Callable[[Any], Awaitable[Any]], **options) -> Sink:
+        # options同Sink: maxsize, timeout, policy, key, on_discard
+        sink = self.sinks[name] = Sink(name, func, **options)
+        return sink
+
+    def dispatch(self, msg: Any):
+        # 只入队, 不等待投递
+        for sink in self.sinks.values():
+            sink.offer(msg)
+
+    async def callback(self, msg: Any):
+        # 可以直接作为SubscriptionRunner的callback
+        self.dispatch(msg)
+
+    async def close(self, timeout: Optional[float] = DRAIN_TIMEOUT):
+        # 各sink并行投递剩余的消息后停止
+        await asyncio.gather(*(sink.close(timeout) for sink in self.sinks.values()))
+
+    def stats(self) -> dict[str, dict]:
+        return {name: sink.stats() for name, sink in self.sinks.items()}
@@ -0,0 +1,193 @@
+import bisect
+import contextvars
+import math
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Optional
+from logs import logger
+
+# 订阅流水线的分阶段耗时: 每个阶段(cron_fire_lag/fetch/parse/llm/callback)是一个span, 按(阶段, labels)汇总到直方图,
+# 可导出为文本或prometheus格式; 一次订阅运行(run)结束时输出各阶段耗时, 定位推送延迟的原因;
+# 通过环境变量PIPELINE_TRACING=0关闭, 关闭后span为共享的空对象, 几乎没有开销
+TRACING_ENV = "PIPELINE_TRACING"
+# prometheus风格的直方图桶, 单位秒
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# 计算分位数时只保留最近的样本
+DEFAULT_RESERVOIR = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_NAME = "pipeline_stage_seconds"
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS, reservoir: int = DEFAULT_RESERVOIR):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples: deque = deque(maxlen=reservoir)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def quantile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+class Span:
+    __slots__ = ("tracer", "name", "labels", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, labels: dict):
+        self.tracer = tracer
+        self.name = name
+        self.labels = labels
+        self.start = 0.0
+
+    def set(self, **labels):
+        # 结束前补充labels, 如llm缓存是否命中
+        self.labels.update(labels)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.labels["error"] = exc_type.__name__
+        self.tracer.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **labels):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Run:
+    # 一次订阅运行: 从trigger触发到callback完成, 累计其间各阶段的耗时
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+        self.start = time.perf_counter()
+        self.stages: dict[str, list] = {}
+        self.finished = False
+
+    def add(self, stage: str, seconds: float):
+        total = self.stages.setdefault(stage, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+
+    def summary(self) -> str:
+        # 并发的阶段(如多个url的fetch)耗时相加, 括号内为次数
+        return ", ".join(f"{stage} {seconds:.2f}s({count})" for stage, (seconds, count) in self.stages.items())
+
+
+_current_run: contextvars.ContextVar[Optional[Run]] = contextvars.ContextVar("pipeline_run", default=None)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(name: str, labels: tuple, extra: tuple = ()) -> str:
+    pairs = (("stage", name),) + labels + extra
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class Tracer:
+    def __init__(self, enabled: bool = True, buckets: tuple = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.histograms: dict[tuple[str, tuple], Histogram] = {}
+
+    def span(self, name: str, **labels):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, labels)
+
+    def observe(self, name: str, seconds: float, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        histogram.observe(seconds)
+        run = _current_run.get()
+        if run is not None and not run.finished:
+            run.add(name, seconds)
+
+    def start_run(self, name: str, **labels) -> Optional[Run]:
+        # 之后在同一个task(及其创建的task)中结束的span都计入该run
+        if not self.enabled:
+            return None
+        previous = _current_run.get()
+        if previous is not None and not previous.finished:
+            logger.warning(f"{previous.name} run did not finish: {previous.summary()}")
+        run = Run(name, labels)
+        _current_run.set(run)
+        return run
+
+    def finish_run(self, **labels):
+        run = _current_run.get()
+        if run is None or run.finished:
+            return
+        seconds = time.perf_counter() - run.start
+        run.finished = True
+        labels = {**run.labels, **labels}
+        self.observe(run.name, seconds, **labels)
+        logger.info(f"{run.name} {labels} took {seconds:.2f}s: {run.summary()}")
+
+    def reset(self):
+        self.histograms.clear()
+
+    def render_text(self) -> str:
+        lines = [f"{'stage':40} {'count':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"]
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            label = name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+            p50, p95, p99 = (histogram.quantile(q) for q in QUANTILES)
+            lines.append(
+                f"{label:40} {histogram.count:>7} {p50:>8.3f}s {p95:>8.3f}s {p99:>8.3f}s {histogram.max:>8.3f}s"
+            )
+        return "\n".join(lines)
+
+    def render_prometheus(self) -> str:
+        lines = [f"# HELP {METRIC_NAME} Latency of the subscription pipeline stages.", f"# TYPE {METRIC_NAME} histogram"]
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f"{METRIC_NAME}_bucket{_format_labels(name, labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{METRIC_NAME}_sum{_format_labels(name, labels)} {histogram.sum}")
+            lines.append(f"{METRIC_NAME}_count{_format_labels(name, labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+async def traced_trigger(trigger, name: str, **labels) -> AsyncIterator:
+    # 包装SubscriptionRunner的trigger, 每次触发开始一个run; callback中调用tracer.finish_run结束
+    async for msg in trigger:
+        tracer.start_run(name, **labels)
+        yield msg
+
+
+# 进程内共享的collector
+tracer = Tracer(enabled=os.environ.get(TRACING_ENV, "1").lower() not in ("0", "false", "no", "off"))
@@ -8,8 +8,13 @@ from metagpt.utils.common import OutputParser
 from datetime import datetime
 from metagpt.const import METAGPT_ROOT
 from metagpt.utils.file import File
+import os
+import sys
 
-class WriteDirectory(Action):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from llm_cache import CachedAction
+
+class WriteDirectory(CachedAction):
     language: str = ""
 
     def __init__(self, name:str="", language:str="Chinese", *args, **kwargs):
@@ -36,15 +41,18 @@ class WriteDirectory(Action):
         """
 
         prompt = DIRECTORY_PROMPT.format(topic=topic, language=self.language)
-        rsp = await self._aask(prompt=prompt)
-        try:
-            return OutputParser.extract_struct(rsp, dict)
-        except Exception as e:
-            logger.error(f"Failed to parse the directory: {e}")
-            return None
-
-
-class WriteContent(Action):
+        async with self.cached_llm as llm:
+            rsp = await llm.aask(prompt)
+            try:
+                return OutputParser.extract_struct(rsp, dict)
+            except Exception as e:
+                # 解析失败的响应不写入缓存, 重新运行时会再次请求LLM
+                await llm.discard()
+                logger.error(f"Failed to parse the directory: {e}")
+                return None
+
+
+class WriteContent(CachedAction):
     language: str = ""
     directory: str = ""
 
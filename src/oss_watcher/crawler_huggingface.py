@@ -1,19 +1,47 @@
-import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
+import os
+import random
 import re
+import sys
 import time
-from metagpt.config import CONFIG 
+import aiohttp
+from metagpt.logs import logger
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from html_parser import parse_document
+from http_session import HostRateLimiter, http_sessions
+
+# 论文详情页并发抓取的参数: 同时进行的请求数, 对huggingface每秒的请求数, 单个请求的超时和重试
+DETAIL_CONCURRENCY = 8
+HOST_RATE = 10  # requests/s
+FETCH_TIMEOUT = 15  # s
+FETCH_RETRIES = 3
+RETRY_BACKOFF = 0.5  # s, 每次重试翻倍
+# 可以重试的http状态码
+RETRY_STATUS = (429, 500, 502, 503, 504)
 
-async def fetch(url):
-    # connector = aiohttp.TCPConnector(ssl=True, proxy="http://127.0.0.1:49682")
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, proxy=CONFIG.GLOBAL_PROXY) as response:
-            response.raise_for_status()
-            return await response.text()
+rate_limiter = HostRateLimiter(HOST_RATE)
+
+# 列表页和各论文详情页共用进程内的连接池, 走http_sessions配置的代理;
+# 连接错误、超时和429/5xx按指数退避重试, 429时优先使用Retry-After
+async def fetch(url, retries: int = FETCH_RETRIES, timeout: float = FETCH_TIMEOUT):
+    for attempt in range(retries + 1):
+        await rate_limiter.wait(url)
+        try:
+            return await http_sessions.get_text(url, timeout=timeout, use_proxy=True)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status = getattr(e, "status", None)
+            if attempt == retries or (status is not None and status not in RETRY_STATUS):
+                raise
+            delay = RETRY_BACKOFF * 2 ** attempt * (1 + random.random())
+            retry_after = (getattr(e, "headers", None) or {}).get("Retry-After", "")
+            if status == 429 and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            logger.info(f"fetch {url} failed: {type(e).__name__} {status or ''}, retry in {delay:.1f}s")
+            await asyncio.sleep(delay)
 
 async def parse_huggingface_paper(html):
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = parse_document(html)
     base_url = "https://huggingface.co"
     papers = []
     paper_elements = soup.select('article.rounded-xl.border')
@@ -27,7 +55,7 @@ async def parse_huggingface_paper(html):
     return papers
 
 async def parse_huggingface_paper_detail(html):
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = parse_document(html)
     paper_detail = {}
     base_url = "https://huggingface.co"
     # authors
@@ -55,20 +83,33 @@ def print_each_papaer(paper):
     print(f"论文PDF地址: {paper['pdf_url']}")
     print("\n\n")
 
-async def crawle_huggingface_papers(date: str, verbose: bool = False):
+async def crawle_paper_detail(paper: dict, limit: asyncio.Semaphore):
+    # 单篇论文抓取失败时字段为None, 不影响其他论文
+    paper_detail = {'abstract': None, 'authors': [], 'pdf_url': None}
+    if paper['url']:
+        async with limit:
+            try:
+                paper_detail = await parse_huggingface_paper_detail(await fetch(paper['url']))
+            except Exception as e:
+                logger.warning(f"failed to crawl paper detail {paper['url']}: {type(e).__name__} {e}")
+    paper['abstract'] = paper_detail['abstract']
+    paper['authors'] = paper_detail['authors']
+    paper['pdf_url'] = paper_detail['pdf_url']
+    return paper
+
+async def crawle_huggingface_papers(date: str, verbose: bool = False, concurrency: int = DETAIL_CONCURRENCY):
     html = await fetch(f"https://huggingface.co/papers?date={date}")
     papers = await parse_huggingface_paper(html)
     print(f"Get huggingface {len(papers)} papers")
-    # parse each paper's detail
-    for paper in papers[:4]:
-        paper_detail_html = await fetch(paper['url'])
-        paper_detail = await parse_huggingface_paper_detail(paper_detail_html)
-        paper['abstract'] = paper_detail['abstract']
-        paper['authors'] = paper_detail['authors']
-        paper['pdf_url'] = paper_detail['pdf_url']
-        if verbose:
+    # 并发抓取所有论文的详情, 受concurrency和rate_limiter限制; gather保持列表原来的顺序
+    start = time.perf_counter()
+    limit = asyncio.Semaphore(concurrency)
+    papers = await asyncio.gather(*(crawle_paper_detail(paper, limit) for paper in papers))
+    logger.info(f"crawled {len(papers)} paper details in {time.perf_counter() - start:.2f}s")
+    if verbose:
+        for paper in papers:
             print_each_papaer(paper)
-    return papers  
+    return papers
 
 async def main():
     local_time = time.localtime()
@@ -76,7 +117,10 @@ async def main():
     year, month = local_time.tm_year, local_time.tm_mon
     date= f"{year}-{month}-{prev_date}"
     # parse huggingface papers of the day
-    crawle_huggingface_papers(date, verbose=True)
+    try:
+        await crawle_huggingface_papers(date, verbose=True)
+    finally:
+        await http_sessions.close()
     print("done")
 
 if __name__ == "__main__":
@@ -1,21 +1,20 @@
-import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
+import os
 import re
+import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from html_parser import parse_document
+from http_session import http_sessions
+from trending_records import TrendingRepo, parse_count
+
+# 使用进程内共享的连接池; 与原来一样, 默认直连, 指定proxy时才走代理
 async def fetch(url, proxy: str=None):
-    async with aiohttp.ClientSession() as session:
-        if not proxy is None:
-            async with session.get(url, proxy=proxy) as response:
-                response.raise_for_status()
-                return await response.text()
-        else:
-            async with session.get(url) as response:
-                response.raise_for_status()
-                return await response.text()
+    return await http_sessions.get_text(url, proxy=proxy)
 
-async def parse_html(html):
-    soup = BeautifulSoup(html, 'html.parser')
+# 返回TrendingRepo记录, star/fork/今日star解析为数字
+async def parse_html(html) -> list[TrendingRepo]:
+    soup = parse_document(html)
 
     repositories = []
     repo_elements = soup.find_all('article', class_='Box-row')
@@ -30,39 +29,38 @@ async def parse_html(html):
         language_element = repo_element.select_one('span[itemprop="programmingLanguage"]')
         today_start_element = repo_element.select_one('span.d-inline-block.float-sm-right')
 
-        name = name_element.text.strip()
-        url = 'https://github.com' + url_element['href'].strip()
+        # href为/owner/repo, 比h2中带换行和空格的文本更紧凑
+        name = url_element['href'].strip().strip('/') if url_element else name_element.text.strip()
         description = description_element.text.strip() if description_element else None
-        star_count = star_element.text.strip()
-        fork_count = fork_element.text.strip()
         language = language_element.text.strip() if language_element else None
-        today_starts = today_start_element.text.strip() if today_start_element else None
 
-        repositories.append({
-            'name': name,
-            'url': url,
-            'description': description,
-            'star_count': star_count,
-            'fork_count': fork_count,
-            'language': language,
-            'today_starts': today_starts
-        })
+        repositories.append(TrendingRepo(
+            name=name,
+            description=description,
+            language=language,
+            stars=parse_count(star_element.text if star_element else None),
+            forks=parse_count(fork_element.text if fork_element else None),
+            stars_today=parse_count(today_start_element.text if today_start_element else None),
+        ))
 
     return repositories
 
 async def main():
     url = 'https://github.com/trending'
-    html = await fetch(url)
+    try:
+        html = await fetch(url)
+    finally:
+        await http_sessions.close()
     repositories = await parse_html(html)
 
     for repo in repositories:
-        print(f"仓库名: {repo['name']}")
-        print(f"仓库URL: {repo['url']}")
-        print(f"仓库描述: {repo['description']}")
-        print(f"Star数: {repo['star_count']}")
-        print(f"Fork数: {repo['fork_count']}")
-        print(f"语言类型: {repo['language']}")
-        print(f"今日Star数: {repo['today_starts']}")
+        print(f"仓库名: {repo.name}")
+        print(f"仓库URL: {repo.url}")
+        print(f"仓库描述: {repo.description}")
+        print(f"Star数: {repo.stars}")
+        print(f"Fork数: {repo.forks}")
+        print(f"语言类型: {repo.language}")
+        print(f"今日Star数: {repo.stars_today}")
         print("\n")
 
 if __name__ == '__main__':
@@ -1,11 +1,30 @@
 from typing import Optional
-import aiohttp
+import asyncio
 import os
+import random
+import sys
+import aiohttp
 from dotenv import load_dotenv, find_dotenv
+from metagpt.logs import logger
 from metagpt.schema import Message
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from http_session import http_sessions
+
 _ = load_dotenv(find_dotenv())
 
+# wxpusher单条消息content的长度上限(字符)
+MAX_CONTENT = 40000
+# 接口处理成功的code
+SUCCESS_CODE = 1000
+DELIVERY_RETRIES = 4
+RETRY_BACKOFF = 1.0  # s, 每次重试翻倍
+# 单条消息投递(包括重试)的超时, 作为wxpusher sink的timeout
+DELIVERY_TIMEOUT = 180  # s
+
+class WxPusherError(Exception):
+    pass
+
 class WxPusherClient:
     def __init__(self, token: Optional[str] = None, base_url: str = "http://wxpusher.zjiecode.com"):
         self.base_url = base_url
@@ -33,15 +52,87 @@ class WxPusherClient:
             "url": url
         }
         url = f"{self.base_url}/api/send/message"
-        return await self._request("POST", url, json=payload)
+        result = await self._request("POST", url, json=payload)
+        # 业务错误(如token无效)返回200和非1000的code, 重试没有意义
+        if isinstance(result, dict) and (
+            result.get("code", SUCCESS_CODE) != SUCCESS_CODE or not result.get("success", True)
+        ):
+            logger.error(f"wxpusher rejected the message: code={result.get('code')}, msg={result.get('msg')}")
+            raise WxPusherError(f"wxpusher code={result.get('code')}: {result.get('msg')}")
+        return result
     
+    # 复用进程内共享的连接池; wxpusher在国内, 与原来一样直连不走代理
     async def _request(self, method, url, **kwargs):
-        async with aiohttp.ClientSession() as session:
-            async with session.request(method, url, **kwargs) as response:
-                response.raise_for_status()
-                return await response.json()
+        return await http_sessions.request_json(method, url, **kwargs)
+
+def split_content(content: str, limit: int = MAX_CONTENT) -> list[str]:
+    # 超出长度上限的报告按行拆分为多条, 单行超长时按字符截断
+    parts, current = [], ""
+    for line in content.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            parts.append(current)
+            current = ""
+        current += line
+    if current or not parts:
+        parts.append(current)
+    return parts
+
+class WxPusherSender:
+    # 发送消息并等待结果: 复用一个client, 超长时拆分, 网络错误时指数退避重试, 最终失败时抛出异常.
+    # 投递队列是SinkDispatcher中wxpusher sink的有界队列: 积压时同一role的旧报告被新报告替换(coalesce),
+    # 超时和计数也由sink负责, 退出时dispatcher.close()发送剩余的消息
+    def __init__(
+        self,
+        client: Optional[WxPusherClient] = None,
+        retries: int = DELIVERY_RETRIES,
+        limit: int = MAX_CONTENT,
+    ):
+        self._client = client
+        self.retries = retries
+        self.limit = limit
+
+    @property
+    def client(self) -> WxPusherClient:
+        if self._client is None:
+            self._client = WxPusherClient()
+        return self._client
+
+    async def send(
+        self,
+        content: str,
+        content_type: int = 1,
+        topic_ids: Optional[list[int]] = None,
+        uids: Optional[list[int]] = None,
+    ):
+        for part in split_content(content, self.limit):
+            await self._deliver(part, content_type, topic_ids, uids)
+
+    async def _deliver(
+        self, content: str, content_type: int, topic_ids: Optional[list[int]], uids: Optional[list[int]]
+    ):
+        for attempt in range(self.retries + 1):
+            try:
+                return await self.client.send_message(
+                    content, content_type=content_type, topic_ids=topic_ids, uids=uids
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise WxPusherError(f"wxpusher delivery failed after {attempt + 1} attempts: {e!r}") from e
+                delay = RETRY_BACKOFF * 2 ** attempt * (1 + random.random())
+                logger.info(f"wxpusher delivery failed: {type(e).__name__}, retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            # 业务错误或配置错误(如缺少WXPUSHER_UIDS)不重试, 直接抛出
+
+# 进程内共享的发送器
+wxpusher_sender = WxPusherSender()
 
-# callback是将Role执行后的message发送到wxpusher
+# callback是将Role执行后的message发送到wxpusher, 等待发送完成(包括重试); 失败时抛出异常.
+# 作为SinkDispatcher的sink使用, 订阅的callback只入队, 发送的耗时不阻塞订阅的运行
 async def wxpusher_callback(msg: Message):
-    client = WxPusherClient()
-    await client.send_message(msg.content)
\ No newline at end of file
+    await wxpusher_sender.send(msg.content)
@@ -1,11 +1,15 @@
+import os
+import sys
 import time
 import asyncio
 from pydantic import BaseModel, Field
 from pytz import BaseTzInfo
 from typing import Optional
-from aiocron import crontab
 from metagpt.schema import Message
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from cron_scheduler import cron_scheduler
+
 
 class OssInfo(BaseModel):
     url: str
@@ -13,15 +17,25 @@ class OssInfo(BaseModel):
 
 class GithubTrendingCronTrigger:
 
-    def __init__(self, spec: str, tz: Optional[BaseTzInfo]=None, url: str="https://github.com/trending") -> None:
+    def __init__(self, spec: str, tz: Optional[BaseTzInfo]=None, url: str="https://github.com/trending", jitter: float=0) -> None:
         self.url = url
-        self.crontab = crontab(spec, tz=tz)
-    
+        self.spec = spec
+        self.tz = tz
+        self.jitter = jitter
+        # 所有trigger共享进程内的cron_scheduler, 不再各自创建aiocron.crontab; job在第一次迭代时注册
+        self.job = None
+
     def __aiter__(self):
         return self
-    
+
     async def __anext__(self):
-        await self.crontab.next()
+        if self.job is None:
+            self.job = cron_scheduler.add(self.spec, tz=self.tz, jitter=self.jitter)
+        try:
+            await self.job.wait()
+        except asyncio.CancelledError:
+            cron_scheduler.remove(self.job)
+            raise
         return Message(content=self.url, instruct_content=OssInfo(url=self.url))
 
 async def GithubTrendingIntervalTrigger(url: str="https://github.com/trending"):
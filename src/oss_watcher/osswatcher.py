@@ -1,6 +1,7 @@
 from crawler_trending import fetch, parse_html
+from trending_history import trending_history, trending_report
 from osstrigger import OssInfo, GithubTrendingCronTrigger, GithubTrendingIntervalTrigger
-from osscallback import wxpusher_callback
+from osscallback import DELIVERY_TIMEOUT, wxpusher_callback
 from metagpt.actions import Action
 from metagpt.config import CONFIG
 from metagpt.schema import Message
@@ -8,15 +9,45 @@ from metagpt.subscription import SubscriptionRunner
 from metagpt.environment import Environment
 from metagpt.logs import logger
 from metagpt.roles import Role
-from typing import Any
+from pydantic import BaseModel
+from typing import Optional
 import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from llm_cache import CachedAction
+from map_reduce import map_reduce_summarize, record_text
+from http_session import http_sessions
+from tracing import traced_trigger, tracer
+from single_flight import single_flight
+from sink_dispatcher import COALESCE, SinkDispatcher
+
+# 报告消息的id -> 对应的快照id, 报告投递成功后标记快照为已报告
+report_snapshots: dict[str, int] = {}
+
+class TrendingReport(BaseModel):
+    # 报告按行作为map-reduce的记录; 本次报告对应的快照, 没有记录快照时为None
+    records: list[str]
+    snapshot_id: Optional[int] = None
+
+async def crawl_trending(url: str) -> TrendingReport:
+    #  html = await fetch(url, proxy=CONFIG.GLOBAL_PROXY)
+     with tracer.span("fetch"):
+          html = await fetch(url)
+     with tracer.span("parse"):
+          repositories = await parse_html(html)
+     if not repositories:
+          logger.warning(f"no repositories parsed from {url}, the snapshot is not recorded")
+     # 快照追加到本地的历史中; 第一次运行时交给LLM紧凑的完整表格, 之后只发送与上次报告的差异
+     with tracer.span("history"):
+          report, snapshot_id = await asyncio.to_thread(trending_report, trending_history, repositories)
+     return TrendingReport(records=report.splitlines(), snapshot_id=snapshot_id)
 
 class CrawlOSSTrending(Action):
-    async def run(self, url: str="https://github.com/trending"):
-        #  html = await fetch(url, proxy=CONFIG.GLOBAL_PROXY)
-         html = await fetch(url) 
-         repositories = await parse_html(html)
-         return repositories
+    async def run(self, url: str="https://github.com/trending") -> TrendingReport:
+         # 多个OssWatcher同时触发时只抓取一次, 也只追加一个快照, 各role得到同一份报告
+         return await single_flight.do((url, crawl_trending), lambda: crawl_trending(url))
 
 TRENDING_ANALYSIS_PROMPT="""# Requirements
 You are a GitHub Trending Analyst, aiming to provide users with insightful and personalized recommendations based on the latest
@@ -52,14 +83,30 @@ The top popular projects are Project1 and Project2.
 
 ---
 context:
+The context is pre-aggregated from today's GitHub Trending. On the first run it has the language distribution, the top repositories by stars gained today, the domains of the repositories, and a table of all repositories ranked by stars today. On later runs it only has the changes since the last report: repositories new today or back on the list, the ones that dropped out, the fastest rising this week and the ones still on the list; focus the report on these changes.
 
 # Github Trending
 {trending}
 """
 
-class AnalysisOSSTrending(Action):
-     async def run(self, trending: Any):
-          return await self._aask(TRENDING_ANALYSIS_PROMPT.format(trending=trending))
+# trending列表超出token预算时, 先分块提取各仓库的要点, 再基于要点生成分析报告
+TRENDING_MAP_PROMPT="""# Requirements
+The context is part {index} of {total} of today's GitHub Trending list. For each repository write one line with its name, url, language, total stars, stars today and a short description, then list the domains covered by this part. Do not write the report yet.
+
+# Github Trending
+{trending}
+"""
+
+class AnalysisOSSTrending(CachedAction):
+     async def run(self, trending: list[str]):
+          join = lambda records: "\n".join(record_text(record) for record in records)
+          return await map_reduce_summarize(
+               self._aask,
+               trending,
+               lambda records: TRENDING_ANALYSIS_PROMPT.format(trending=join(records)),
+               lambda chunk, index, total: TRENDING_MAP_PROMPT.format(index=index, total=total, trending=join(chunk)),
+               model=getattr(self.llm, "model", None),
+          )
 
 class OssWatcher(Role):
     def __init__(self, 
@@ -75,28 +122,67 @@ class OssWatcher(Role):
         logger.info(f"{self._setting}: prepare to run {self.rc.todo}")
         todo = self.rc.todo
         msg = self.get_memories(k=1)[0]
-        result = await todo.run(msg.content)
-        msg = Message(content=str(result), role=self.profile, cause_by=type(todo))
+        if isinstance(todo, AnalysisOSSTrending):
+            # 抓取的报告作为instruct_content传递, 分析直接使用其中的记录
+            report = msg.instruct_content
+            result = await todo.run(report.records)
+            msg = Message(content=str(result), role=self.profile, cause_by=type(todo))
+            if report.snapshot_id is not None:
+                report_snapshots[msg.id] = report.snapshot_id
+        else:
+            report = await todo.run(msg.content)
+            msg = Message(
+                content="\n".join(report.records), instruct_content=report, role=self.profile, cause_by=type(todo)
+            )
         self.rc.memory.add(msg)
         return msg
 
+def mark_reported(deliver):
+    # 包装sink: 报告投递成功后才把快照标记为已报告; 投递失败、超时或被新报告替换时不标记,
+    # 下次运行仍与上次报告的快照比较
+    async def _deliver(msg: Message):
+        snapshot_id = report_snapshots.pop(msg.id, None)
+        await deliver(msg)
+        if snapshot_id is not None:
+            await asyncio.to_thread(trending_history.mark_reported, snapshot_id)
+    return _deliver
+
+def forget_report(msg: Message):
+    # sink丢弃或合并掉的报告不会再投递
+    report_snapshots.pop(msg.id, None)
+
 async def main(spec: str = "0 9 * * *", wxpusher: bool = True):
     env = Environment()
-    callbacks = []    
+    # 每个sink有自己的有界队列和超时, 慢的或失败的sink不影响订阅和其他sink;
+    # wxpusher积压时同一个role还没发出的报告被新的报告替换
+    dispatcher = SinkDispatcher()
     if wxpusher:
-        callbacks.append(wxpusher_callback)
+        # sink的有界队列就是wxpusher的投递队列, sink中直接发送(拆分/重试), 积压、超时和stats对应的是真实的投递
+        dispatcher.add(
+            "wxpusher", mark_reported(wxpusher_callback),
+            policy=COALESCE, timeout=DELIVERY_TIMEOUT, on_discard=forget_report,
+        )
 
-    if not callbacks:
+    if not dispatcher.sinks:
         async def _print(msg: Message):
             print(msg.content)
-        callbacks.append(_print)
+        dispatcher.add("print", mark_reported(_print), on_discard=forget_report)
     
     async def callback(msg):
-        await asyncio.gather(*[call(msg) for call in callbacks])
+        # 只入队, 立即返回
+        with tracer.span("callback"):
+            dispatcher.dispatch(msg)
+        tracer.finish_run()
     
     runner = SubscriptionRunner()
     # await runner.subscribe(OssWatcher(), GithubTrendingCronTrigger(spec), callback)
-    await runner.subscribe(OssWatcher(), GithubTrendingIntervalTrigger(), callback)
-    await runner.run()
+    await runner.subscribe(OssWatcher(), traced_trigger(GithubTrendingIntervalTrigger(), "trending_run"), callback)
+    try:
+        await runner.run()
+    finally:
+        # 先投递各sink中剩余的消息, 再关闭爬虫和wxpusher共用的连接池
+        await dispatcher.close()
+        logger.info(f"sinks: {dispatcher.stats()}")
+        await http_sessions.close()
 
 asyncio.run(main())
\ No newline at end of file
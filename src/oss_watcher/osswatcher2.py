@@ -8,8 +8,13 @@ from metagpt.logs import logger
 from typing import ClassVar
 from crawler_huggingface import crawle_huggingface_papers
 import time
+import os
+import sys
 
-class WriteTableOfContent(Action):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from llm_cache import CachedAction
+
+class WriteTableOfContent(CachedAction):
     PROMPT_TEMPLATE: ClassVar["str"] = """
     you are paper analyst, please abstract the context information below and output table of content based on it. the output format is as such:
     ---
@@ -0,0 +1,241 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from trending_records import TABLE_HEADER, TrendingRepo, format_trending, table_row, top_by_today
+
+# GitHub Trending的历史快照: 每次运行追加一个快照, 仓库用整数id存储, 每条记录只有几个整数;
+# 在本地计算与上次报告的差异(新上榜/重新上榜/掉榜)、首次上榜时间和star增速, 只把变化发送给LLM;
+# 快照在报告投递成功后才标记为已报告(mark_reported), 分析或投递失败时下次运行仍与上次报告的快照比较, 变化不会丢失;
+# sqlite是阻塞调用, 在async代码中通过asyncio.to_thread调用trending_report/mark_reported, 连接由锁保护
+DEFAULT_HISTORY_PATH = os.environ.get(
+    "TRENDING_HISTORY_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "metagpt-sample", "trending_history.sqlite3"),
+)
+# star增速的统计窗口
+VELOCITY_DAYS = 7
+# 只有一个观测点或间隔太短时, 用当天的stars today作为增速
+MIN_VELOCITY_SPAN = 0.5 * 86400
+DEFAULT_TOP_K = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS repos (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    first_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    taken REAL NOT NULL,
+    reported INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS entries (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id),
+    repo_id INTEGER NOT NULL REFERENCES repos(id),
+    rank INTEGER NOT NULL,
+    stars INTEGER NOT NULL,
+    forks INTEGER NOT NULL,
+    stars_today INTEGER NOT NULL,
+    PRIMARY KEY (snapshot_id, repo_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_repo ON entries(repo_id, snapshot_id);
+CREATE INDEX IF NOT EXISTS snapshots_taken ON snapshots(taken);
+"""
+
+
+class TrendingDiff:
+    def __init__(self, snapshot_id: int, previous_id: Optional[int]):
+        self.snapshot_id = snapshot_id
+        self.previous_id = previous_id
+        self.new: list[str] = []          # 第一次上榜
+        self.returning: list[str] = []    # 以前上过榜, 上次报告时不在榜上
+        self.dropped: list[str] = []      # 上次报告时在榜上, 这次不在
+        # 两次都在榜上的仓库: name -> (上次的排名, 这次的排名, 期间增加的star)
+        self.continuing: dict[str, tuple[int, int, int]] = {}
+
+
+class TrendingHistory:
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(snapshots)")]
+            if "reported" not in columns:
+                # 旧版本的快照在记录时都已报告过
+                with self._conn:
+                    self._conn.execute("ALTER TABLE snapshots ADD COLUMN reported INTEGER NOT NULL DEFAULT 0")
+                    self._conn.execute("UPDATE snapshots SET reported = 1")
+        return self._conn
+
+    def record(self, repos: list[TrendingRepo], taken: Optional[float] = None) -> int:
+        # 追加一个未报告的快照, 排名按页面上的顺序; 返回快照id
+        taken = taken if taken is not None else time.time()
+        with self.conn as conn:
+            snapshot_id = conn.execute("INSERT INTO snapshots (taken) VALUES (?)", (taken,)).lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO repos (name, first_seen) VALUES (?, ?)", ((repo.name, taken) for repo in repos)
+            )
+            ids = self._repo_ids([repo.name for repo in repos])
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (snapshot_id, ids[repo.name], rank, repo.stars, repo.forks, repo.stars_today)
+                    for rank, repo in enumerate(repos, 1)
+                ),
+            )
+        return snapshot_id
+
+    def _repo_ids(self, names: list[str]) -> dict[str, int]:
+        ids = {}
+        # sqlite的参数个数有上限, 分批查询
+        for i in range(0, len(names), 500):
+            batch = names[i:i + 500]
+            ids.update(self.conn.execute(
+                f"SELECT name, id FROM repos WHERE name IN ({','.join('?' * len(batch))})", batch
+            ).fetchall())
+        return ids
+
+    def mark_reported(self, snapshot_id: int):
+        with self._lock, self.conn as conn:
+            conn.execute("UPDATE snapshots SET reported = 1 WHERE id = ?", (snapshot_id,))
+
+    def previous_snapshot(self, snapshot_id: int) -> Optional[int]:
+        # 之前最后一个已报告的快照
+        row = self.conn.execute(
+            "SELECT MAX(id) FROM snapshots WHERE id < ? AND reported = 1", (snapshot_id,)
+        ).fetchone()
+        return row[0]
+
+    def _entries(self, snapshot_id: int) -> dict[str, tuple[int, int]]:
+        # name -> (rank, stars)
+        rows = self.conn.execute(
+            "SELECT r.name, e.rank, e.stars FROM entries e JOIN repos r ON r.id = e.repo_id WHERE e.snapshot_id = ?",
+            (snapshot_id,),
+        )
+        return {name: (rank, stars) for name, rank, stars in rows}
+
+    def diff(self, snapshot_id: int) -> TrendingDiff:
+        previous_id = self.previous_snapshot(snapshot_id)
+        diff = TrendingDiff(snapshot_id, previous_id)
+        current = self._entries(snapshot_id)
+        previous = self._entries(previous_id) if previous_id is not None else {}
+        # 在本快照之前报告过的仓库
+        seen = {name for (name,) in self.conn.execute(
+            "SELECT DISTINCT r.name FROM entries e JOIN repos r ON r.id = e.repo_id"
+            " JOIN snapshots s ON s.id = e.snapshot_id"
+            " WHERE e.snapshot_id < ? AND s.reported = 1"
+            " AND e.repo_id IN (SELECT repo_id FROM entries WHERE snapshot_id = ?)",
+            (snapshot_id, snapshot_id),
+        )}
+        for name, (rank, stars) in sorted(current.items(), key=lambda i: i[1][0]):
+            if name in previous:
+                previous_rank, previous_stars = previous[name]
+                diff.continuing[name] = (previous_rank, rank, stars - previous_stars)
+            elif name in seen:
+                diff.returning.append(name)
+            else:
+                diff.new.append(name)
+        diff.dropped = [name for name, _ in sorted(previous.items(), key=lambda i: i[1][0]) if name not in current]
+        return diff
+
+    def first_seen(self, names: list[str]) -> dict[str, float]:
+        rows = self.conn.execute(
+            f"SELECT name, first_seen FROM repos WHERE name IN ({','.join('?' * len(names))})", names
+        ) if names else []
+        return dict(rows)
+
+    def star_velocity(self, days: float = VELOCITY_DAYS, now: Optional[float] = None) -> dict[str, float]:
+        # 窗口内第一次和最后一次观测之间每天增加的star; 只观测到一次时用stars_today
+        since = (now if now is not None else time.time()) - days * 86400
+        rows = self.conn.execute(
+            """
+            WITH observed AS (
+                SELECT e.repo_id, s.taken, e.stars, e.stars_today,
+                       ROW_NUMBER() OVER (PARTITION BY e.repo_id ORDER BY s.taken) AS first_rank,
+                       ROW_NUMBER() OVER (PARTITION BY e.repo_id ORDER BY s.taken DESC) AS last_rank
+                FROM entries e JOIN snapshots s ON s.id = e.snapshot_id
+                WHERE s.taken >= ?
+            )
+            SELECT r.name,
+                   MAX(CASE WHEN last_rank = 1 THEN stars END) - MAX(CASE WHEN first_rank = 1 THEN stars END),
+                   MAX(taken) - MIN(taken),
+                   MAX(CASE WHEN last_rank = 1 THEN stars_today END)
+            FROM observed o JOIN repos r ON r.id = o.repo_id
+            GROUP BY o.repo_id
+            """,
+            (since,),
+        )
+        return {
+            name: gained / (span / 86400) if span >= MIN_VELOCITY_SPAN else float(today)
+            for name, gained, span, today in rows
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def format_trending_diff(
+    repos: list[TrendingRepo],
+    diff: TrendingDiff,
+    velocity: dict[str, float],
+    first_seen: dict[str, float],
+    top_k: int = DEFAULT_TOP_K,
+) -> str:
+    # 只发送与上次报告的差异: 新上榜/重新上榜的仓库给出完整的行, 仍在榜上的只列出名字和变化
+    by_name = {repo.name: repo for repo in repos}
+    lines = [f"{len(repos)} repositories on the list, url is https://github.com/<repo>"]
+    lines += ["", f"## New today ({len(diff.new)})", TABLE_HEADER]
+    lines += [table_row(by_name[name]) for name in diff.new]
+    if diff.returning:
+        lines += ["", f"## Back on the list ({len(diff.returning)})", f"{TABLE_HEADER}|first seen"]
+        lines += [
+            f"{table_row(by_name[name])}|{time.strftime('%Y-%m-%d', time.localtime(first_seen[name]))}"
+            for name in diff.returning
+        ]
+    lines += ["", f"## Dropped out since the last report ({len(diff.dropped)})", ", ".join(diff.dropped) or "-"]
+    rising = sorted(
+        (name for name in by_name if name in velocity), key=lambda name: velocity[name], reverse=True
+    )[:top_k]
+    lines += ["", "## Rising fastest this week (stars/day)"]
+    lines.append(", ".join(f"{name} ({velocity[name]:,.0f})" for name in rising))
+    lines += ["", "## Still on the list (rank last -> now, stars gained since the last report)"]
+    lines.append(", ".join(
+        f"{name} ({previous}->{rank}, +{gained:,})" for name, (previous, rank, gained) in diff.continuing.items()
+    ) or "-")
+    lines += ["", f"## Top {top_k} by stars today"]
+    lines.append(", ".join(f"{repo.name} (+{repo.stars_today:,})" for repo in top_by_today(repos, top_k)))
+    return "\n".join(lines)
+
+
+def trending_report(
+    history: TrendingHistory, repos: list[TrendingRepo], taken: Optional[float] = None
+) -> tuple[str, Optional[int]]:
+    # 记录本次快照, 返回(报告, 快照id); 还没有报告过的快照时发送完整的表格, 之后只发送差异.
+    # 报告投递成功后由调用方mark_reported; 没有解析到仓库时(页面改版/请求被拦截)不记录快照, 快照id为None,
+    # 否则这次会把所有仓库报告为掉榜, 下次又报告为重新上榜
+    if not repos:
+        return format_trending(repos), None
+    with history._lock:
+        snapshot_id = history.record(repos, taken)
+        diff = history.diff(snapshot_id)
+        if diff.previous_id is None:
+            return format_trending(repos), snapshot_id
+        velocity, first_seen = history.star_velocity(now=taken), history.first_seen(diff.returning)
+    return format_trending_diff(repos, diff, velocity, first_seen), snapshot_id
+
+
+# 进程内共享的历史存储
+trending_history = TrendingHistory()
@@ -0,0 +1,106 @@
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+# GitHub Trending的类型化记录: 把页面上的"1,234", "312 stars today"解析为数字,
+# 在本地完成语言分布、按今日star排序和领域分组, 发送给LLM的是紧凑的预排序表格, 而不是python的repr
+DEFAULT_TOP_K = 5
+# 表格中描述的最大长度
+MAX_DESCRIPTION = 120
+UNKNOWN_LANGUAGE = "Unknown"
+OTHER_DOMAIN = "Other"
+# 按仓库名和描述中的关键词归类, 先匹配到的领域优先
+DOMAIN_KEYWORDS = (
+    ("AI/LLM", r"llms?|gpt|agents?|ai|models?|diffusion|rag|transformers?|chatbot|machine learning|deep learning"
+               r"|neural|inference|embeddings?|prompts?|copilot|whisper|vision"),
+    ("Web/Frontend", r"react|vue|svelte|frontend|web|css|html|next\.?js|browser|ui|components?"),
+    ("DevOps/Cloud", r"kubernetes|k8s|docker|cloud|devops|deploy\w*|infrastructure|terraform|ci/cd|serverless"),
+    ("Data", r"database|sql|data|analytics|etl|vector|storage|search"),
+    ("Security", r"security|vulnerabilit\w*|pentest\w*|exploits?|malware|privacy|auth\w*"),
+    ("Mobile", r"android|ios|mobile|flutter|swift\w*"),
+    ("Developer Tools", r"cli|terminal|editor|ide|compiler|sdk|framework|library|tools?|plugin|debug\w*"),
+)
+DOMAIN_PATTERNS = tuple((domain, re.compile(rf"\b(?:{pattern})\b", re.I)) for domain, pattern in DOMAIN_KEYWORDS)
+NUMBER_RE = re.compile(r"\d[\d,]*")
+TABLE_HEADER = "repo|language|stars today|stars|forks|description"
+
+
+def parse_count(text: Optional[str]) -> int:
+    # "1,234" / "312 stars today" -> 1234 / 312
+    match = NUMBER_RE.search(text or "")
+    return int(match.group().replace(",", "")) if match else 0
+
+
+def classify_domain(name: str, description: Optional[str]) -> str:
+    text = f"{name.replace('-', ' ').replace('_', ' ')} {description or ''}"
+    for domain, pattern in DOMAIN_PATTERNS:
+        if pattern.search(text):
+            return domain
+    return OTHER_DOMAIN
+
+
+@dataclass
+class TrendingRepo:
+    __slots__ = ("name", "description", "language", "stars", "forks", "stars_today")
+    name: str  # owner/repo
+    description: Optional[str]
+    language: Optional[str]
+    stars: int
+    forks: int
+    stars_today: int
+
+    @property
+    def url(self) -> str:
+        return f"https://github.com/{self.name}"
+
+    @property
+    def domain(self) -> str:
+        return classify_domain(self.name, self.description)
+
+
+def language_distribution(repos: list[TrendingRepo]) -> list[tuple[str, int, int]]:
+    # (语言, 仓库数, 今日star数), 按仓库数和今日star数排序
+    counts, today = Counter(), Counter()
+    for repo in repos:
+        language = repo.language or UNKNOWN_LANGUAGE
+        counts[language] += 1
+        today[language] += repo.stars_today
+    return sorted(((lang, counts[lang], today[lang]) for lang in counts), key=lambda i: (-i[1], -i[2], i[0]))
+
+
+def top_by_today(repos: list[TrendingRepo], k: Optional[int] = None) -> list[TrendingRepo]:
+    ranked = sorted(repos, key=lambda repo: (-repo.stars_today, -repo.stars))
+    return ranked if k is None else ranked[:k]
+
+
+def group_by_domain(repos: list[TrendingRepo]) -> dict[str, list[TrendingRepo]]:
+    groups: dict[str, list[TrendingRepo]] = {}
+    for repo in top_by_today(repos):
+        groups.setdefault(repo.domain, []).append(repo)
+    # 仓库多的领域在前, Other放在最后
+    return dict(sorted(groups.items(), key=lambda i: (i[0] == OTHER_DOMAIN, -len(i[1]))))
+
+
+def _cell(text: Optional[str], limit: int = MAX_DESCRIPTION) -> str:
+    text = " ".join((text or "-").split()).replace("|", "/")
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def table_row(repo: TrendingRepo) -> str:
+    # 与TABLE_HEADER的列对应
+    return f"{repo.name}|{repo.language or '-'}|{repo.stars_today}|{repo.stars}|{repo.forks}|{_cell(repo.description)}"
+
+
+def format_trending(repos: list[TrendingRepo], top_k: int = DEFAULT_TOP_K) -> str:
+    # 发送给LLM的紧凑表格; url为https://github.com/<repo>, 领域只在Domains中列出, 不再逐行重复
+    ranked = top_by_today(repos)
+    lines = [f"{len(repos)} repositories, url is https://github.com/<repo>", "", "## Languages (repos, stars today)"]
+    lines.append(", ".join(f"{lang} {count} ({today:,})" for lang, count, today in language_distribution(repos)))
+    lines += ["", f"## Top {top_k} by stars today"]
+    lines.append(", ".join(f"{repo.name} (+{repo.stars_today:,})" for repo in ranked[:top_k]))
+    lines += ["", "## Domains"]
+    lines += [f"{domain}: {', '.join(repo.name for repo in group)}" for domain, group in group_by_domain(repos).items()]
+    lines += ["", "## Repositories ranked by stars today", f"rank|{TABLE_HEADER}"]
+    lines += [f"{rank}|{table_row(repo)}" for rank, repo in enumerate(ranked, 1)]
+    return "\n".join(lines)
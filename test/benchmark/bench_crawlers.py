@@ -0,0 +1,177 @@
+import argparse
+import ast
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(ROOT, "..", "..", "src")
+sys.path.append(os.path.join(SRC, "common"))
+sys.path.append(os.path.join(SRC, "oss_watcher"))
+sys.path.append(os.path.join(SRC, "adv_subscriptor"))
+from metagpt.utils.parse_html import WebPage
+from html_parser import get_soup, resolve_backend
+from crawler_trending import parse_html
+from crawler_huggingface import parse_huggingface_paper, parse_huggingface_paper_detail
+from parse_registry import parse_registry
+from outline import get_outline
+
+# 离线的爬虫/解析benchmark: 在test/benchmark/fixtures的页面上测量各解析函数的吞吐和内存峰值, 结果保存为json,
+# 与之前版本的结果对比即可发现性能回退; fixtures是按各网站的页面结构生成的合成页面, 不是保存的真实页面,
+# 不请求网络和LLM; 但爬虫模块通过http_session导入了metagpt的CONFIG, 与运行示例一样需要配置LLM的key
+# (config/key.yaml或OPENAI_API_KEY等环境变量), 否则导入时报错
+# usage: python test/benchmark/bench_crawlers.py [--repeat 20] [--output result.json] [--compare baseline.json]
+FIXTURES = os.path.join(ROOT, "fixtures")
+RESULTS_DIR = os.path.join(ROOT, "results")
+# adv_subscriptor2.test.py中给36kr生成的示例parse function
+SAMPLE_TEST_FILE = os.path.join(SRC, "adv_subscriptor", "adv_subscriptor2.test.py")
+# 与baseline相比耗时增加超过该比例时认为是回退
+DEFAULT_THRESHOLD = 0.2
+
+
+def run_sync(coro):
+    # 爬虫的parse函数是没有await的协程, 直接驱动, 不把event loop的开销计入耗时
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError("parse coroutine awaited unexpectedly")
+
+
+def load_sample_parse():
+    # 取出test_add_subscription中code = """..."""的源码, 按worker的方式编译
+    tree = ast.parse(open(SAMPLE_TEST_FILE, encoding="utf-8").read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "code" for t in node.targets):
+            return parse_registry.get_parse(node.value.value)
+    raise LookupError(f"no sample parse code in {SAMPLE_TEST_FILE}")
+
+
+def cases():
+    sample_parse = load_sample_parse()
+    outline = lambda html: get_outline(WebPage(inner_text="", html=html, url=""))
+    return [
+        ("parse_html", "github_trending.html", lambda html: run_sync(parse_html(html))),
+        ("parse_huggingface_paper", "huggingface_papers.html", lambda html: run_sync(parse_huggingface_paper(html))),
+        ("parse_huggingface_paper_detail", "huggingface_paper_detail.html",
+         lambda html: run_sync(parse_huggingface_paper_detail(html))),
+        # 与parse_pool一致, 计入生成soup的耗时
+        ("sample_parse", "36kr_financing_flash.html", lambda html: sample_parse(get_soup(html))),
+        ("get_outline", "github_trending.html", outline),
+        ("get_outline", "huggingface_papers.html", outline),
+        ("get_outline", "huggingface_paper_detail.html", outline),
+        ("get_outline", "36kr_financing_flash.html", outline),
+    ]
+
+
+def result_size(result) -> int:
+    if isinstance(result, dict):
+        return sum(1 for value in result.values() if value)
+    return len(result)
+
+
+def bench(func, html, repeat) -> dict:
+    result = func(html)  # warm up, 也用于检查fixture是否仍能解析出内容
+    timings = []
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(html)
+            timings.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    # tracemalloc会拖慢执行, 单独运行一次测量内存峰值
+    tracemalloc.start()
+    try:
+        func(html)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    median = statistics.median(timings)
+    return {
+        "bytes": len(html.encode("utf-8")),
+        "items": result_size(result),
+        "repeat": repeat,
+        "mean_ms": statistics.mean(timings) * 1000,
+        "median_ms": median * 1000,
+        "min_ms": min(timings) * 1000,
+        "pages_per_s": 1 / median,
+        "mb_per_s": len(html.encode("utf-8")) / median / 1024 / 1024,
+        "peak_kb": peak / 1024,
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for key, result in results.items():
+        previous = baseline["results"].get(key)
+        if previous is None:
+            continue
+        change = result["median_ms"] / previous["median_ms"] - 1
+        memory = result["peak_kb"] / previous["peak_kb"] - 1 if previous["peak_kb"] else 0
+        print(f"  {key:62} time {change:+7.1%}  memory {memory:+7.1%}")
+        if change > threshold or memory > threshold:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="json file to save the results, default test/benchmark/results/<time>.json")
+    parser.add_argument("--compare", help="baseline json saved by a previous run")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    results = {}
+    for name, fixture, func in cases():
+        with open(os.path.join(FIXTURES, fixture), encoding="utf-8") as f:
+            html = f.read()
+        key = f"{name}[{fixture}]"
+        results[key] = result = bench(func, html, args.repeat)
+        if not result["items"]:
+            print(f"warning: {key} parsed nothing, the fixture or the parser is broken")
+        print(f"{key:62} {result['median_ms']:8.2f} ms  {result['pages_per_s']:8.1f} pages/s  "
+              f"{result['mb_per_s']:6.2f} MB/s  peak {result['peak_kb']:8.0f} KB  {result['items']:>4} items")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "html_parser_backend": resolve_backend(),
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"crawlers-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"compare with {args.compare} (revision {baseline.get('revision')})")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
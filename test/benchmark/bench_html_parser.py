@@ -0,0 +1,87 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, "..", "..", "src", "common"))
+sys.path.append(os.path.join(ROOT, "..", "..", "src", "oss_watcher"))
+from html_parser import BACKEND_ENV, available_backends, get_soup, parse_document, soup_builder
+from crawler_trending import parse_html
+from crawler_huggingface import parse_huggingface_paper, parse_huggingface_paper_detail
+from bench_crawlers import run_sync
+
+# 对比各html解析后端在保存的页面上的耗时: 只解析文档, 解析后执行爬虫的查询, 以及outline/parse function使用的bs4 soup
+# usage: python test/benchmark/bench_html_parser.py [page.html ...]
+# 不指定页面时, 使用test/benchmark/fixtures下保存的页面, 以及生成的trending/huggingface列表页面;
+# 与bench_crawlers一样需要配置LLM的key(爬虫模块导入了metagpt的CONFIG)
+
+
+def trending_page(rows: int = 2000) -> str:
+    row = ("<article class='Box-row'><h2 class='h3 lh-condensed'><a href='/a/b'>a / b</a></h2>"
+           "<p class='col-9 color-fg-muted'>description</p><div class='f6'>"
+           "<span itemprop='programmingLanguage'>Python</span><a href='/a/b/stargazers'>1,234</a>"
+           "<a href='/a/b/forks'>56</a><span class='d-inline-block float-sm-right'>12 stars today</span></div></article>")
+    return "<html><body><main><div class='Box'>" + row * rows + "</div></main></body></html>"
+
+
+def papers_page(rows: int = 2000) -> str:
+    row = ("<article class='rounded-xl border'><a class='cursor-pointer' href='/papers/2401.00001'>"
+           "<img src='x.png'></a><h3 class='mb-1 text-lg'>A paper title</h3></article>")
+    return "<html><body><section>" + row * rows + "</section></body></html>"
+
+
+def crawler_for(name: str):
+    # 按页面名选择对应的爬虫解析函数
+    if "trending" in name:
+        return parse_html
+    if "detail" in name:
+        return parse_huggingface_paper_detail
+    if "paper" in name:
+        return parse_huggingface_paper
+    return None
+
+
+def measure(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def bench(name, html, repeat):
+    print(f"## {name} ({len(html)/1024:.0f} KB)")
+    crawler = crawler_for(name)
+    baseline = None
+    for backend in available_backends():
+        os.environ[BACKEND_ENV] = backend
+        _, parse_elapsed = measure(lambda: parse_document(html), repeat)
+        line = f"  {backend:11}: document {parse_elapsed*1000:8.1f} ms"
+        if crawler is not None:
+            result, crawl_elapsed = measure(lambda: run_sync(crawler(html)), repeat)
+            baseline = result if baseline is None else baseline
+            line += f"  crawler {crawl_elapsed*1000:8.1f} ms  same={result == baseline}"
+        _, soup_elapsed = measure(lambda: get_soup(html, backend), repeat)
+        line += f"  soup({soup_builder(backend)}) {soup_elapsed*1000:8.1f} ms"
+        print(line)
+    os.environ.pop(BACKEND_ENV, None)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pages", nargs="*", help="saved html pages")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = args.pages or sorted(glob.glob(os.path.join(ROOT, "fixtures", "*.html")))
+    for path in pages:
+        with open(path, encoding="utf-8") as f:
+            bench(os.path.basename(path), f.read(), args.repeat)
+    if not args.pages:
+        bench("synthetic-trending", trending_page(), args.repeat)
+        bench("synthetic-papers", papers_page(), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+import tiktoken
+from bs4 import BeautifulSoup
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, "..", "..", "src", "adv_subscriptor"))
+from outline import build_outline
+
+# 对比原来递归的get_outline与outline.build_outline在大页面上的耗时/内存/输出大小, 以及折叠重复节点节省的token数
+# usage: python test/benchmark/bench_outline.py [page.html ...]
+# 不指定页面时, 使用test/benchmark/fixtures下保存的页面, 以及生成的深层/宽列表页面
+
+def legacy_outline(soup: BeautifulSoup) -> str:
+    outline = []
+
+    def process_element(element, depth):
+        name = element.name
+        if not name:
+            return
+        if name in ["script", "style"]:
+            return
+        element_info = {"name": element.name, "depth": depth}
+        if name in ["svg"]:
+            element_info["text"] = None
+            outline.append(element_info)
+            return
+        element_info["text"] = element.string
+        if "class" in element.attrs:
+            element_info["class"] = element["class"]
+        outline.append(element_info)
+        for child in element.children:
+            process_element(child, depth+1)
+
+    for element in soup.body.children:
+        process_element(element, 1)
+    return "\n".join(f"{' '*i['depth']}{'.'.join([i['name'], *i.get('class', [])])}:{i['text'] if i['text'] else ''}" for i in outline)
+
+
+def deep_page(depth: int = 3000) -> str:
+    return "<html><body>" + "<div class='wrap'>" * depth + "<span>leaf</span>" + "</div>" * depth + "</body></html>"
+
+
+def wide_page(rows: int = 3000) -> str:
+    row = ("<article class='Box-row'><h2 class='h3'><a href='/a/b'>a / b</a></h2>"
+           "<p class='col-9'>description</p><div class='f6'><a href='/a/b/stargazers'>1,234</a>"
+           "<span class='d-inline-block float-sm-right'>12 stars today</span></div></article>")
+    return "<html><body><main><div class='Box'>" + row * rows + "</div></main></body></html>"
+
+
+def measure(func, soup, repeat):
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = func(soup)
+        elapsed = (time.perf_counter() - start) / repeat
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+ENCODING = tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    return len(ENCODING.encode(text, disallowed_special=()))
+
+
+def bench(name, html, repeat):
+    soup = BeautifulSoup(html, "html.parser")
+    print(f"## {name} ({len(html)/1024:.0f} KB)")
+    try:
+        text, elapsed, peak = measure(legacy_outline, soup, repeat)
+        print(f"  recursive: {elapsed*1000:8.1f} ms  peak {peak/1024:8.0f} KB  {len(text):>9} chars  {count_tokens(text):>8} tokens")
+    except RecursionError:
+        print("  recursive: RecursionError")
+    unlimited = {"max_nodes": None, "max_depth": None, "max_chars": None}
+    for label, budget in (("iterative", {**unlimited, "keep_repeated": None}),
+                          ("collapsed", unlimited),
+                          ("budgeted", {"keep_repeated": None}),
+                          ("default", {})):
+        (text, stats), elapsed, peak = measure(lambda s: build_outline(s, **budget), soup, repeat)
+        print(f"  {label:9}: {elapsed*1000:8.1f} ms  peak {peak/1024:8.0f} KB  {len(text):>9} chars  "
+              f"{count_tokens(text):>8} tokens  {stats.summary()}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pages", nargs="*", help="saved html pages")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = args.pages or sorted(glob.glob(os.path.join(ROOT, "fixtures", "*.html")))
+    for path in pages:
+        with open(path, encoding="utf-8") as f:
+            bench(os.path.basename(path), f.read(), args.repeat)
+    if not args.pages:
+        bench("synthetic-deep", deep_page(), args.repeat)
+        bench("synthetic-wide", wide_page(), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
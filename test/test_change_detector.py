@@ -0,0 +1,67 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "adv_subscriptor"))
+from change_detector import ChangeDetector
+
+# 订阅结果的变更检测; 可用pytest运行, 也可直接python test/test_change_detector.py
+
+URL = "https://a.com"
+
+
+def test_first_run_is_full():
+    detector = ChangeDetector()
+    delta = detector.diff("s1", {URL: [1, 2]})
+    assert delta.changed and not delta.incremental and delta.previous_summary is None
+
+
+def test_unchanged_reuses_summary():
+    detector = ChangeDetector()
+    detector.commit("s1", {URL: [1, 2]}, "summary")
+    delta = detector.diff("s1", {URL: [1, 2]})
+    assert not delta.changed and delta.previous_summary == "summary"
+    # 顺序变化不算新增记录
+    assert not detector.diff("s1", {URL: [2, 1]}).new_items
+
+
+def test_added_records_are_incremental():
+    detector = ChangeDetector()
+    detector.commit("s1", {URL: [{"title": "a"}]}, "summary")
+    delta = detector.diff("s1", {URL: [{"title": "b"}, {"title": "a"}]})
+    assert delta.changed and delta.incremental
+    assert delta.new_items == {URL: [{"title": "b"}]}
+    assert delta.previous_summary == "summary"
+
+
+def test_removed_records_are_full():
+    detector = ChangeDetector()
+    detector.commit("s1", {URL: [1, 2]}, "summary")
+    delta = detector.diff("s1", {URL: [2, 3]})
+    assert delta.changed and not delta.incremental
+    # url集合变化时也重新总结
+    assert not detector.diff("s1", {URL: [1, 2], "https://b.com": [1]}).incremental
+
+
+def test_uncommitted_run_is_not_recorded():
+    # LLM总结失败时不commit, 下次仍然是完整的总结
+    detector = ChangeDetector()
+    detector.diff("s1", {URL: [1]})
+    assert detector.diff("s1", {URL: [1]}).changed
+
+
+def test_dump_and_load():
+    detector = ChangeDetector()
+    detector.commit("s1", {URL: [1, 2]}, "summary")
+    restored = ChangeDetector()
+    restored.load("s1", detector.dump("s1"))
+    delta = restored.diff("s1", {URL: [1, 2]})
+    assert not delta.changed and delta.previous_summary == "summary"
+    restored.forget("s1")
+    assert restored.diff("s1", {URL: [1, 2]}).changed
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name} ok")
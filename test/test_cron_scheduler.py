@@ -0,0 +1,81 @@
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "common"))
+from cron_scheduler import CronSpec
+
+# CronSpec的解析和匹配规则; 可用pytest运行, 也可直接python test/test_cron_scheduler.py
+
+
+def test_ranges_and_lists():
+    spec = CronSpec("0-10/5,30 9-11 * * *")
+    assert spec.minutes == [0, 5, 10, 30]
+    assert spec.hours == [9, 10, 11]
+    assert spec.days == list(range(1, 32))
+
+
+def test_steps():
+    assert CronSpec("*/15 * * * *").minutes == [0, 15, 30, 45]
+    # 单个起始值带step时, 一直到字段的上限
+    assert CronSpec("50/4 * * * *").minutes == [50, 54, 58]
+    assert CronSpec("* * * * */2").weekdays == [0, 2, 4, 6]
+
+
+def test_sunday_as_7():
+    assert CronSpec("0 0 * * 7").weekdays == [0]
+    assert CronSpec("0 0 * * 5-7").weekdays == [0, 5, 6]
+    assert CronSpec("0-59/15 * * * 0-7").weekdays == list(range(7))
+    assert CronSpec("0 0 * * 1-7/2").weekdays == [0, 1, 3, 5]
+
+
+def test_names():
+    spec = CronSpec("0 0 * jan,Jun-aug mon-fri")
+    assert spec.months == [1, 6, 7, 8]
+    assert spec.weekdays == [1, 2, 3, 4, 5]
+    # 跨周日的范围
+    assert CronSpec("0 0 * * fri-sun").weekdays == [0, 5, 6]
+
+
+def test_macros():
+    assert CronSpec("@daily").next_after(datetime(2024, 3, 1, 10, 0)) == datetime(2024, 3, 2, 0, 0)
+    assert CronSpec("@hourly").next_after(datetime(2024, 3, 1, 10, 0)) == datetime(2024, 3, 1, 11, 0)
+
+
+def test_invalid():
+    for spec in ("* * * *", "60 * * * *", "* 24 * * *", "* * 0 * *", "* * * 13 *", "* * * * 8", "*/0 * * * *"):
+        try:
+            CronSpec(spec)
+        except ValueError:
+            continue
+        raise AssertionError(f"{spec!r} should be invalid")
+
+
+def test_day_or_weekday():
+    # day和weekday都有限制时, 满足其一即可: 2024-03-01是周五, 03-04是周一
+    spec = CronSpec("0 0 15 * 1")
+    assert spec.next_after(datetime(2024, 3, 1)) == datetime(2024, 3, 4)
+    assert spec.next_after(datetime(2024, 3, 12)) == datetime(2024, 3, 15)
+
+
+def test_day_or_weekday_with_all_days():
+    # 覆盖所有取值的字段等同于*, 只按另一个字段匹配
+    assert CronSpec("0 0 15 * 0-7").next_after(datetime(2024, 3, 1)) == datetime(2024, 3, 15)
+    assert CronSpec("0 0 1-31 * 1").next_after(datetime(2024, 3, 1)) == datetime(2024, 3, 4)
+    assert CronSpec("0 0 */1 * 1").next_after(datetime(2024, 3, 1)) == datetime(2024, 3, 4)
+
+
+def test_next_after():
+    spec = CronSpec("30 14 * * *")
+    assert spec.next_after(datetime(2024, 3, 1, 14, 29, 59)) == datetime(2024, 3, 1, 14, 30)
+    # 严格晚于给定时间
+    assert spec.next_after(datetime(2024, 3, 1, 14, 30)) == datetime(2024, 3, 2, 14, 30)
+    assert CronSpec("0 0 29 2 *").next_after(datetime(2023, 3, 1)) == datetime(2024, 2, 29)
+    assert CronSpec("0 0 31 * *").next_after(datetime(2024, 4, 1)) == datetime(2024, 5, 31)
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name} ok")
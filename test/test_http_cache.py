@@ -0,0 +1,84 @@
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "common"))
+from http_cache import HttpCache, cache_key, fresh_until, parse_vary
+
+# 爬虫GET请求的磁盘缓存; 可用pytest运行, 也可直接python test/test_http_cache.py
+
+URL = "https://a.com/page"
+FRESH = {"Cache-Control": "max-age=600"}
+
+
+def open_cache() -> HttpCache:
+    return HttpCache(os.path.join(tempfile.mkdtemp(), "http_cache.sqlite3"))
+
+
+def test_cache_key_headers():
+    # 请求头名不区分大小写; user-agent和accept-language始终计入key
+    assert cache_key(URL, {"User-Agent": "a"}) == cache_key(URL, {"user-agent": "a"})
+    assert cache_key(URL, {"User-Agent": "a"}) != cache_key(URL, {"User-Agent": "b"})
+    # 不在key中的请求头不影响key, Vary列出的才计入
+    assert cache_key(URL, {"Cookie": "x"}) == cache_key(URL, {"Cookie": "y"})
+    assert cache_key(URL, {"Cookie": "x"}, ["cookie"]) != cache_key(URL, {"Cookie": "y"}, ["cookie"])
+
+
+def test_parse_vary():
+    assert parse_vary("Accept-Encoding, Cookie,cookie") == ["accept-encoding", "cookie"]
+    assert parse_vary(None) == []
+
+
+def test_fresh_until():
+    assert fresh_until({"Cache-Control": "max-age=60"}, 1000) == 1060
+    assert fresh_until({"Cache-Control": "max-age=60", "Age": "10"}, 1000) == 1050
+    assert fresh_until({"Cache-Control": "no-cache"}, 1000) == 1000
+    assert fresh_until({"Cache-Control": "no-store"}, 1000) is None
+
+
+def test_key_includes_request_headers():
+    cache = open_cache()
+    cache.set(URL, FRESH, "english", {"Accept-Language": "en"})
+    cache.set(URL, FRESH, "chinese", {"Accept-Language": "zh"})
+    assert cache.get(URL, {"Accept-Language": "en"}).text == "english"
+    assert cache.get(URL, {"Accept-Language": "zh"}).text == "chinese"
+    assert cache.get(URL, {"Accept-Language": "fr"}) is None
+
+
+def test_vary_header_splits_entries():
+    cache = open_cache()
+    headers = {**FRESH, "Vary": "Cookie"}
+    cache.set(URL, headers, "user a", {"Cookie": "a"})
+    cache.set(URL, headers, "user b", {"Cookie": "b"})
+    assert cache.get(URL, {"Cookie": "a"}).text == "user a"
+    assert cache.get(URL, {"Cookie": "b"}).text == "user b"
+    assert cache.get(URL, {"Cookie": "c"}) is None
+
+
+def test_vary_star_and_no_store_are_not_stored():
+    cache = open_cache()
+    cache.set(URL, {**FRESH, "Vary": "*"}, "page")
+    assert cache.get(URL) is None
+    cache.set(URL, {"Cache-Control": "no-store"}, "page")
+    assert cache.get(URL) is None
+    # 已过期又没有验证器, 无法重新验证
+    cache.set(URL, {"Cache-Control": "no-cache"}, "page")
+    assert cache.get(URL) is None
+
+
+def test_revalidate():
+    cache = open_cache()
+    cache.set(URL, {"Cache-Control": "no-cache", "ETag": '"v1"'}, "page")
+    cached = cache.get(URL)
+    assert not cached.fresh
+    assert cached.conditional_headers() == {"If-None-Match": '"v1"'}
+    cache.revalidate(cached.key, FRESH)
+    cached = cache.get(URL)
+    assert cached.fresh and cached.text == "page" and cached.etag == '"v1"'
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name} ok")
@@ -0,0 +1,66 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "adv_subscriptor"))
+from outline import build_outline
+
+# outline的节点/字符/深度预算和重复节点的折叠; 可用pytest运行, 也可直接python test/test_outline.py
+
+# ul下10个相同的列表项(每个2个节点), 以及5层嵌套(5个节点), 共26个节点
+HTML = (
+    "<html><body><ul class='list'>" + "<li class='item'><a href='#'>x</a></li>" * 10 + "</ul>"
+    "<div><div><div><div><p>deep</p></div></div></div></div></body></html>"
+)
+UNLIMITED = dict(max_nodes=0, max_depth=0, max_chars=0, keep_repeated=None)
+
+
+def test_unlimited():
+    text, stats = build_outline(HTML, **UNLIMITED)
+    assert stats.nodes == 26 == len(text.splitlines())
+    assert stats.chars == len(text) + 1
+    assert not stats.truncated
+
+
+def test_collapse_repeated_siblings():
+    text, stats = build_outline(HTML, **{**UNLIMITED, "keep_repeated": 2})
+    assert text.count("li.item:x") == 2
+    assert "  li.item:×8 more" in text.splitlines()
+    # 被折叠的8个li及其子节点a
+    assert (stats.collapsed_runs, stats.collapsed_nodes) == (1, 16)
+    # 折叠不算截断
+    assert not stats.truncated
+
+
+def test_node_budget():
+    text, stats = build_outline(HTML, **{**UNLIMITED, "max_nodes": 3})
+    assert len(text.splitlines()) == stats.nodes == 3
+    assert stats.truncated_by == "nodes"
+    assert stats.omitted_nodes == 26 - 3
+
+
+def test_char_budget():
+    text, stats = build_outline(HTML, **{**UNLIMITED, "max_chars": 40})
+    assert stats.chars <= 40 and stats.chars == len(text) + 1
+    assert stats.truncated_by == "chars"
+    assert stats.nodes + stats.omitted_nodes == 26
+
+
+def test_depth_budget():
+    text, stats = build_outline(HTML, **{**UNLIMITED, "max_depth": 2})
+    assert stats.max_depth == 2
+    assert max(len(line) - len(line.lstrip(" ")) for line in text.splitlines()) == 2
+    # 10个li下的a, 以及第2层div下的3个节点
+    assert (stats.pruned_subtrees, stats.pruned_nodes) == (11, 13)
+    assert stats.truncated and stats.truncated_by is None
+
+
+def test_default_budget_summary():
+    _, stats = build_outline(HTML)
+    assert stats.summary() == "outline nodes=11 chars=124 depth=5, collapsed 1 repeated runs (16 nodes)"
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name} ok")
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "common"))
+from single_flight import SingleFlight
+
+# 相同请求的合并; 可用pytest运行, 也可直接python test/test_single_flight.py
+
+
+def test_concurrent_calls_share_one_execution():
+    flight, calls = SingleFlight(), []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"html": "page"}
+
+    async def main():
+        return await asyncio.gather(*(flight.do("url", fetch) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    # 得到同一个结果对象
+    assert all(result is results[0] for result in results)
+    assert (flight.executed, flight.shared, len(flight)) == (1, 4, 0)
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+
+    async def main():
+        return await asyncio.gather(
+            flight.do("a", lambda: asyncio.sleep(0, "a")),
+            flight.do("b", lambda: asyncio.sleep(0, "b")),
+        )
+
+    assert asyncio.run(main()) == ["a", "b"]
+    assert flight.executed == 2
+
+
+def test_failure_is_shared_and_retried():
+    flight, calls = SingleFlight(), []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise ValueError("boom")
+        return "ok"
+
+    async def main():
+        results = await asyncio.gather(flight.do("url", fetch), flight.do("url", fetch), return_exceptions=True)
+        # 失败后不缓存, 之后的调用重新执行
+        return results, await flight.do("url", fetch)
+
+    results, retried = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert retried == "ok" and len(calls) == 2
+
+
+def test_cancelled_caller_does_not_cancel_others():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    async def main():
+        first = asyncio.create_task(flight.do("url", fetch))
+        second = asyncio.create_task(flight.do("url", fetch))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "ok"
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name} ok")
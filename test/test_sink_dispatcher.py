@@ -0,0 +1,98 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "common"))
+from sink_dispatcher import COALESCE, DROP_NEWEST, DROP_OLDEST, Sink, SinkDispatcher
+
+# sink的有界队列、丢弃/合并策略和失败隔离; 可用pytest运行, 也可直接python test/test_sink_dispatcher.py
+
+
+def run_blocked(policy: str, messages: list, **options):
+    # sink在第一条消息上阻塞, 其余消息留在队列中; 返回投递的消息、被丢弃的消息和sink
+    delivered, discarded = [], []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def deliver(msg):
+            await release.wait()
+            delivered.append(msg)
+
+        sink = Sink("test", deliver, policy=policy, on_discard=discarded.append, **options)
+        sink.offer("first")
+        await asyncio.sleep(0)
+        for msg in messages:
+            sink.offer(msg)
+        release.set()
+        await sink.close()
+        return sink
+
+    sink = asyncio.run(main())
+    return delivered, discarded, sink
+
+
+def test_drop_oldest():
+    delivered, discarded, sink = run_blocked(DROP_OLDEST, [1, 2, 3], maxsize=2)
+    assert delivered == ["first", 2, 3]
+    assert discarded == [1]
+    assert sink.stats()["dropped"] == 1 and sink.stats()["high_watermark"] == 2
+
+
+def test_drop_newest():
+    delivered, discarded, _ = run_blocked(DROP_NEWEST, [1, 2, 3], maxsize=2)
+    assert delivered == ["first", 1, 2]
+    assert discarded == [3]
+
+
+def test_coalesce_by_key():
+    messages = [("a", 1), ("b", 1), ("a", 2)]
+    delivered, discarded, sink = run_blocked(COALESCE, messages, key=lambda msg: msg[0])
+    # 同一个key的新消息替换队列中的旧消息, 位置不变
+    assert delivered == ["first", ("a", 2), ("b", 1)]
+    assert discarded == [("a", 1)]
+    assert sink.stats()["coalesced"] == 1
+
+
+def test_unknown_policy():
+    try:
+        Sink("test", None, policy="unknown")
+    except ValueError:
+        return
+    raise AssertionError("unknown policy accepted")
+
+
+def test_failing_sink_does_not_block_others():
+    delivered = []
+
+    async def fail(msg):
+        raise RuntimeError("boom")
+
+    async def slow(msg):
+        await asyncio.sleep(1)
+
+    async def deliver(msg):
+        delivered.append(msg)
+
+    async def main():
+        dispatcher = SinkDispatcher()
+        dispatcher.add("fail", fail)
+        dispatcher.add("slow", slow, timeout=0.01)
+        dispatcher.add("ok", deliver)
+        for msg in range(3):
+            await dispatcher.callback(msg)
+        await dispatcher.close()
+        return dispatcher.stats()
+
+    stats = asyncio.run(main())
+    assert delivered == [0, 1, 2]
+    assert stats["fail"]["failed"] == 3
+    assert stats["slow"]["timed_out"] == 3
+    assert stats["ok"]["delivered"] == 3
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name} ok")
@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "adv_subscriptor"))
+from subscription_store import SubscriptionStore
+
+# 订阅存储的保存/恢复; 可用pytest运行, 也可直接python test/test_subscription_store.py
+
+URLS = ["https://a.com", "https://a.com/page", "https://b.com"]
+# https://a.com/page的parse代码生成失败, 不在code中
+CODE = "# https://a.com\ndef parse(soup):\n    return 1\n# https://b.com\ndef parse(soup):\n    return 2\n"
+
+
+def open_store() -> SubscriptionStore:
+    return SubscriptionStore(os.path.join(tempfile.mkdtemp(), "subscriptions.sqlite3"))
+
+
+def test_round_trip():
+    store = open_store()
+    store.save("s1", URLS, CODE, "summarize", "0 9 * * *", {"Cron Expression": "0 9 * * *"})
+    store.close()
+
+    store = SubscriptionStore(store.path)
+    (sub,) = store.load_all()
+    assert sub.fields() == {
+        "id": "s1", "urls": URLS, "code": CODE, "process": "summarize",
+        "spec": "0 9 * * *", "requirement": {"Cron Expression": "0 9 * * *"},
+    }
+    assert sub.last_fire is None and sub.last_status is None and sub.state is None
+
+
+def test_record_run():
+    store = open_store()
+    store.save("s1", URLS, CODE, "summarize", "0 9 * * *")
+    store.record_run("s1", 100.0, "ok", {"summary": "done"})
+    # 没有触发时间时保留上次的
+    store.record_run("s1", None, "failed")
+    (sub,) = store.load_all()
+    assert (sub.last_fire, sub.last_status, sub.state) == (100.0, "failed", None)
+
+
+def test_save_replaces_and_resets_state():
+    store = open_store()
+    store.save("s1", URLS, CODE, "summarize", "0 9 * * *")
+    store.record_run("s1", 100.0, "ok", {"summary": "done"})
+    store.save("s1", URLS[:1], "# https://a.com\ndef parse(soup):\n    return 3\n", "list", "0 10 * * *")
+    (sub,) = store.load_all()
+    assert sub.urls == URLS[:1]
+    assert sub.code == "# https://a.com\ndef parse(soup):\n    return 3\n"
+    assert (sub.process, sub.spec, sub.last_fire, sub.state) == ("list", "0 10 * * *", None, None)
+
+
+def test_delete():
+    store = open_store()
+    store.save("s1", URLS, CODE, "summarize", "0 9 * * *")
+    store.save("s2", URLS[:1], CODE, "list", "0 10 * * *")
+    assert store.delete("s1")
+    assert not store.delete("s1")
+    assert [sub.id for sub in store.load_all()] == ["s2"]
+    # parse代码随订阅一起删除
+    assert store.conn.execute("SELECT COUNT(*) FROM parse_codes WHERE sub_id='s1'").fetchone()[0] == 0
+
+
+if __name__ == "__main__":
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"{name} ok")